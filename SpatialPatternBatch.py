@@ -0,0 +1,70 @@
+##This program runs the spatial pattern analysis (SpatialPatternRefactor.py or
+##SpatialPattern_NoLayers.py) on many input files in one go. Cases are analyzed side by side
+##on a pool of worker processes, each case is saved to its own output as soon as it is done,
+##and a combined summary of all cases is written at the end.
+
+##If the batch is stopped part way (crash, power cut, closing the window), simply run it
+##again: cases that already have results are skipped and only the rest are analyzed.
+
+####################################################################
+##How to use this program
+
+##Put this program in the same directory as SpatialPatternRefactor.py,
+##SpatialPattern_NoLayers.py and the spatial_pattern folder. The analysis settings (cell
+##types, analysis_dist, sim_run_num, engine, etc.) are taken from the user set variables at
+##the top of the program selected with "layered" below, so set those first. The directory, inputfile
+##and outputfile variables in that program are not used by the batch.
+
+##Prepare each input file as described in Section 2 of that program and put them all in
+##one directory. Set your variables in the section below, and run this program.
+
+####################################################################
+##User set variables here
+
+#Directory containing input files
+batch_directory = "C:\Users\John Morgan\Documents\sp_datafiles"
+
+#Optional list of cases to run: a text file in batch_directory with one input file name per
+#line. A second, tab separated column sets the output name for that case; otherwise the
+#input file name without its extension is used. Leave as None to run every .txt file in
+#batch_directory.
+manifest = None
+
+#Directory that the per-case results and the summary are written to
+output_directory = "C:\Users\John Morgan\Documents\sp_datafiles\\batch_output"
+
+#Name of the combined summary file written to output_directory. A name ending in .txt gives
+#a tab-delimited text file; one ending in .csv, .npz, .parquet or .xlsx gives a table in that
+#format (see output_format in SpatialPatternRefactor.py for the libraries they need).
+summary_file = "batch_summary.txt"
+
+#Format of the file saved for each case: "xls", "csv", "npz", "parquet" or "xlsx", as
+#output_format in SpatialPatternRefactor.py
+output_format = "xls"
+
+#True to analyze layered samples with SpatialPatternRefactor.py, False to analyze
+#non-layered samples with SpatialPattern_NoLayers.py
+layered = True
+
+#Number of cases analyzed at the same time. 0 uses every core on the computer.
+#Inside a batch the simulations of each case always run in the case's own process.
+case_workers = 0
+
+####################################################################
+##Program begins here
+
+import sys
+
+import spatial_pattern
+
+if layered:
+    from SpatialPatternRefactor import config
+else:
+    from SpatialPattern_NoLayers import config
+
+if __name__ == "__main__":
+    failed = spatial_pattern.run_batch(config, batch_directory, output_directory, manifest,
+                                       summary_file, case_workers, output_format)
+    if failed:
+        print str(len(failed)) + " cases failed, run the batch again to retry them"
+        sys.exit(1)
@@ -0,0 +1,69 @@
+##This program measures how fast the spatial pattern analysis runs, stage by stage: loading
+##the input file, the boundaries, building the cell store, the clustering values, making one
+##simulated distribution, and a short simulation loop. It uses the bundled B4925.txt and
+##NoLayer_B4925.txt samples and synthetic samples from 1,000 to 1,000,000 cells, laid out at
+##random ("uniform") or in small groups ("clustered"), and saves the times, throughput, peak
+##memory and scaling exponents of each stage as JSON.
+
+##Keep the JSON of a run as a baseline: a later run with baseline_file set is compared
+##against it, and any stage that got slower than the tolerance allows is listed.
+
+####################################################################
+##How to use this program
+
+##Put this program in the same directory as SpatialPatternRefactor.py and the
+##spatial_pattern folder. The analysis settings (cell types, analysis_dist, edge correction,
+##etc.) are taken from the user set variables at the top of SpatialPatternRefactor.py,
+##except for engine, which is set below. Set your variables in the section below, and run
+##this program.
+
+##Peak memory is measured on Python 3.4 or newer only; on older versions it is left out.
+
+####################################################################
+##User set variables here
+
+#Directory containing B4925.txt and NoLayer_B4925.txt. Missing files are skipped.
+directory = "C:\Users\John Morgan\Documents\sp_datafiles"
+
+#JSON file the results are written to
+output_file = "C:\Users\John Morgan\Documents\sp_datafiles\\benchmark.json"
+
+#JSON file of an earlier run to compare against, or None
+baseline_file = None
+
+#How much slower than the baseline a stage may get before it is listed, 0.25 = 25%
+tolerance = 0.25
+
+#Cell numbers of the synthetic samples. With engine = "python" the largest sizes take a
+#long time; leave out 1000000 or use engine = "numpy".
+sizes = [1000, 10000, 100000, 1000000]
+
+#Synthetic layouts to run: "uniform", "clustered" or both
+layouts = ["uniform", "clustered"]
+
+#Engine to measure, "python" or "numpy" (see SpatialPatternRefactor.py)
+engine = "numpy"
+
+#Each stage is run this many times and the fastest time is kept
+repeats = 3
+
+#Number of simulation runs timed in the simulation loop stage
+sim_runs = 3
+
+#True to measure the peak memory of each stage. This runs every stage once more.
+measure_memory = True
+
+####################################################################
+##Program begins here
+
+import sys
+
+import spatial_pattern
+from SpatialPatternRefactor import config
+
+if __name__ == "__main__":
+    regressions = spatial_pattern.run_benchmarks(config.copy(engine = engine), directory, output_file, sizes,
+                                                 layouts, repeats, sim_runs, measure_memory, baseline_file, tolerance)
+    if regressions:
+        print str(len(regressions)) + " stages are slower than the baseline"
+        sys.exit(1)
@@ -16,6 +16,8 @@
 ##locations *by layer*. It compares an average of these simulation values to the actual 
 ##distribution of cells to detect inhomogeneities in their organization.
 
+##To run this analysis on many input files at once, see SpatialPatternBatch.py.
+
 ####################################################################
 ##Section 1: setting up your computer to run this program
 ##This program is written in Python 2.6-2.7. It also uses the xlwt addon library to make Excel 
@@ -32,8 +34,13 @@
 ##Type cd c:\directory_where_xlwt_was_unzipped_to
 ##Type setup.py install
 
-##Step 3: Copy this program into the c:/Python27 directory
-##You can also put it into another directory that is added to the correct PATH.
+##Optional: to use engine = "numpy" (see below), install the numpy library from here:
+##http://pypi.python.org/pypi/numpy/ (use the Windows installer matching your Python version)
+
+##Step 3: Copy this program and the spatial_pattern folder next to it into the c:/Python27
+##directory. You can also put them into another directory that is added to the correct PATH.
+##The calculations themselves live in the spatial_pattern package; this program only holds
+##the settings for one run.
 
 ####################################################################
 ##Section 2: file preparation for this program (and related scripts)
@@ -57,9 +64,17 @@ directory = "C:\Users\John Morgan\Documents\sp_datafiles"
 #Save as a tab-delimited text file
 inputfile = "B4925.txt"
 
-#This is the name of the .xls file that the program will save when finished. 
+#This is the name of the file that the program will save when finished, without the
+#extension (see output_format).
 outputfile = "test"
 
+##The format of the saved file. "xls" is the original Excel file made with the xlwt library,
+##one sheet per cell pair; its sheets hold at most 255 distances (interval_num up to 254).
+##"csv", "npz", "parquet" and "xlsx" save one table with a row per cell pair and measure and
+##a column per distance, without that limit (see spatial_pattern/tables.py). "npz" needs the
+##numpy library, "parquet" the pyarrow library and "xlsx" the openpyxl library.
+output_format = "xls"
+
 ##This variable adjusts the cell types that are being compared. Input the values in the
 ##first column of your saved .txt file.
 ##In the demo run, neuron = 1, microglia = 3 
@@ -67,6 +82,12 @@ outputfile = "test"
 cell1 = 1
 cell2 = 3
 
+##Optional: a list of cell types, e.g. [1, 2, 3], to get the clustering values of every pair
+##of these types (each type with itself included) from one run. All pairs share one
+##distance search per dataset and one set of simulations. cell1 and cell2 are ignored
+##when this is set; leave as None to compare only cell1 and cell2.
+cell_types = None
+
 ##Number of layers in your sample, this is used to simulate cell distributions by layer
 layer_num = 6
 
@@ -74,217 +95,132 @@ layer_num = 6
 ##excluded from analysis to avoid edge effects
 exclude_dist = 100
 
+##How seed cells near the ROI edges are handled. "exclude" is the original method: seed cells
+##closer than exclude_dist to a boundary are left out. "isotropic" uses every cell as a seed
+##and corrects for the part of its surroundings that lies outside the ROI (Ripley's
+##isotropic edge correction), so no cells are thrown away; this helps most in narrow
+##samples such as thin cortical strips, where excluding cells loses a large share of
+##them. exclude_dist is not used with "isotropic".
+edge_correction = "exclude"
+
 ##This variable adjusts the studied distance and interval in the cleaned output file.
 ##Do not exceed the excluded distance or you will have edge effects distorting your
 ##results!
 analysis_dist = 100
 
-##This variable adjusts the number of interrogation points over the analysis range.
-##It is strongly suggested to match analysis_dist unless you are looking to cut noise
-##with larger distance bins.
+##This variable adjusts the number of interrogation points over the analysis range: the
+##distances from min_dist to analysis_dist are cut into interval_num bins. Matching
+##analysis_dist gives 1 um bins; use fewer to cut noise with larger distance bins, or more
+##for finer ones. The number of bins has little effect on run time.
 interval_num = 100
 
+##Start of the binned range. Pairs closer than min_dist are all counted in the first output
+##column. 0 counts from the start.
+min_dist = 0
+
+##Spacing of the bins. "linear" makes every bin the same width. "log" makes them the same
+##width on a log scale: fine bins at short distances and coarse ones further out, which
+##suits ranges of several orders of magnitude. "log" needs min_dist larger than 0.
+##Next to the clustering values, K(r), L(r) and the pair correlation g(r) are saved for
+##each bin, all relative to the simulations (see spatial_pattern/binning.py).
+bin_spacing = "linear"
+
 ##The number of simulations to run; the results are averaged and then the clustering
 ##values are divided by the simulation results to produce a clustering ratio.
 ##In Morgan et al., 2012, I ran 200 simulations/condition. Experimentation indicated 
 ##that this number of simulations resulted in <1% variability in results.
 sim_run_num = 5
 
+##Optional early stopping for the simulations. When sim_tolerance is set (e.g. 0.01 for 1%),
+##the simulations stop as soon as the relative standard error of the averaged simulation
+##value is below sim_tolerance at every distance, and sim_run_num becomes the maximum
+##number of runs. At least sim_min_runs simulations are always run. With sim_tolerance =
+##None exactly sim_run_num simulations are run. The shortest distances have the fewest
+##pairs and the largest relative error, so they usually decide when the runs stop.
+sim_tolerance = None
+sim_min_runs = 10
+
+##This variable picks the engine used to calculate clustering values. "python" is the
+##original pure Python code. "numpy" keeps the cells in columnar arrays and calculates
+##distances, bins and cumulative counts with array operations; it gives the same
+##clustering curve, much faster, but needs the numpy addon library (see Section 1).
+##The two engines draw different random numbers, so simulated values will not match
+##run for run.
+engine = "python"
+
+##Number of worker processes that run the simulations. 1 runs them one after another in
+##this process, 0 uses every core on the computer. Each simulation run gets its own
+##random numbers, so the results do not depend on the number of workers.
+sim_workers = 1
+
+##Seed for the random numbers used in the simulations. Runs with the same seed give
+##exactly the same results. Leave as None to pick a new seed every time; the seed that
+##was used is printed so that a run can be repeated.
+sim_seed = None
+
+##Optional directory for a binary copy of each input file (needs the numpy library). The text
+##file is converted once; later runs on the same file load the copy almost instantly, and
+##a changed text file is converted again automatically. Useful for repeated batch runs on
+##large files. Leave as None to read the text file every time.
+cache_directory = None
+
+##Optional tiled mode for very large samples, such as whole-slide scans that do not fit in
+##memory. The input file is read a piece at a time and the ROI is cut into square tiles of
+##this size (in the same units as the coordinates) that are analyzed one after another.
+##The data clustering values are exactly the same as without tiles, and with engine =
+##"python" so are the simulations for a given sim_seed. Tiles of a few times analysis_dist
+##work well. Temporary tile files are written to the system temp directory. Leave as None
+##to load the whole file at once.
+tile_size = None
+
+##Optional directory where the averaged simulation values are kept for reuse. The
+##simulations only depend on the number and order of the cell types and layers, the ROI and
+##layer boundaries, the settings above and sim_seed, so analyzing the same sample again (for
+##example with another outputfile) only recalculates the data clustering values. With
+##sim_seed = None any earlier seed is reused; its number is printed and saved as usual.
+##sim_cache_size is the largest size of the directory in megabytes; the values used longest
+##ago are removed first. Leave as None to always run the simulations.
+sim_cache_directory = None
+sim_cache_size = 100
+
+##Optional significance testing against the simulations. Set to two quantiles, e.g.
+##(0.025, 0.975), to also get a band that holds that share of the simulated values at each
+##distance (the envelope), the lowest and highest simulated values, and p-values for more
+##(p clustered) or fewer (p dispersed) cell pairs than chance at each distance. A global
+##test over all distances at once gives one more p-value; use it rather than the pointwise
+##p-values to decide whether a sample is clustered at all. These are saved on an extra
+##sheet per cell pair. Only a fixed amount of memory per distance is used, however many
+##simulations are run. The simulation cache is not used when this is set. Leave as None to
+##skip the tests.
+envelope_quantiles = None
+
+##Optional timing log. Set to a file name, e.g. directory + "\\timing.jsonl", to get one line
+##per analysis stage (loading, boundaries, each clustering run, each simulation run, etc.)
+##with the time it took, counters such as the number of cell pairs looked at, and during the
+##simulations an estimate of the time left. The lines are added to the end of the file in
+##JSON format, so they can be read back by other programs. Leave as None to skip it.
+instrument_file = None
+
 ####################################################################
 ##Program begins here
 
-import csv
-import xlwt
-import math
-import random
 import time
 
-#Load and clean up file, output is sp_data which is a list of all cells 
-#sp_data format is [[celltype1, xcoord1, ycoord1],[celltype2, xcoord2, ycoord2], etc]
-def loadfile():
-    path = directory + "\\" + inputfile
-    input_file_obj = open(path, "r") 
-    csv_read = csv.reader(input_file_obj, dialect = csv.excel_tab)
-    sp_data = []
-    for line in csv_read:
-        sp_data.append(line[0:4])
-    sp_data = sp_data[1:]
-    for cell in sp_data:
-        cell[0], cell[1] = int(cell[0]), float(cell[1]) 
-        cell[2], cell[3] = float(cell[2]), int(cell[3])
-    return sp_data
-
-#This function finds the max and min x and y ROI boundaries in the data file.
-#The data file is modified so that the distance of each cell from these boundaries is recorded
-#in positions cell[4] - cell[7].
-def boundaries(sp_data):
-    xmin, ymin, xmax, ymax = sp_data[0][1], sp_data[0][2], sp_data[0][1], sp_data[0][2]
-    for cell in sp_data:
-        if cell[1] < xmin:
-            xmin = cell[1]
-        if cell[1] > xmax:
-            xmax = cell[1]
-        if cell[2] < ymin:
-            ymin = cell[2]
-        if cell[2] > ymax:
-            ymax = cell[2]
-    for cell in sp_data:
-        xmin_dist = abs(cell[1] - xmin)
-        xmax_dist = abs(xmax - cell[1])
-        ymin_dist = abs(cell[2] - ymin)
-        ymax_dist = abs(ymax - cell[2])
-        cell.append(xmin_dist)
-        cell.append(xmax_dist)
-        cell.append(ymin_dist)
-        cell.append(ymax_dist)
-    return sp_data, xmin, xmax, ymin, ymax
-
-#This sets boundaries by layer so that when random cell location simulations are generated, 
-#they are performed by layer. This is necessary because cell density varies by layer.
-def layer_ybound(sp_data_mod, ymin, ymax):
-    ybound_list = []
-    for layer in range(0, layer_num):
-        layer_list = []
-        for cell in sp_data_mod:
-            if cell[3] == layer + 1:
-                layer_list.append(cell[2])
-        layer_max = layer_list[0]
-        layer_min = layer_list[0]
-        for layer_cell in layer_list:
-            if layer_cell > layer_max:
-                layer_max = layer_cell
-            if layer_cell < layer_min:
-                layer_min = layer_cell
-        ybound_list.append([layer_max, layer_min, layer + 1])
-    #set layer boundaries by averaging the min from one layer with the max from the next layer
-    for layer in range(0, layer_num - 1):
-        try:
-            layer_bound = (ybound_list[layer][1] + ybound_list[layer + 1][0]) / 2
-            ybound_list[layer][1], ybound_list[layer + 1][0] = layer_bound, layer_bound
-            ybound_list[0][0], ybound_list[0][layer_num - 1] = ymax, ymin
-        except:
-            pass     
-    return ybound_list
-
-#Generate clustering values
-#This function is the main speed culprit when launched from Aptana or Eclipse/PyDev.
-#The "for cell/for compare_cell" loop typically runs ~1-2 million times per function call
-#with a data input length of roughly 2500-3000 cells.
-#On my PC, with input case B4925 and celltypes set to 1/3:
-#Aptana and Eclipse loop in ~.5 sec, while IDLE loops in 6-7 sec.
-#Between loops: Aptana/Eclipse <.0001 sec, IDLE: 6-7 sec.
-#Given that I will loop through this 1200-6000 times/case doing various calcs, that's huge!
-def cluster(sp_data, cell1, cell2):
-    print "cluster in: " + str(time.clock())
-    data_cluster = []
-    for unused in range(0, analysis_dist + 1):
-        data_cluster.append(0.)
-    for cell in sp_data:
-        if cell[0] == cell1:
-            if cell[4] > exclude_dist and cell[5] > exclude_dist and cell[6] > exclude_dist and cell[7] > exclude_dist:
-                #setting these variables here shaves ~7-8% off runtime
-                xloc = cell[1]
-                yloc = cell[2]
-                for compare_cell in sp_data:
-                    if compare_cell[0] == cell2:
-                        dist = math.sqrt((xloc - compare_cell[1])**2 + (yloc - compare_cell[2])**2)
-                        if dist > 0 and dist <= analysis_dist:
-                            array_target = int(math.ceil(dist * analysis_dist / interval_num))
-                            for insert in range (array_target, analysis_dist + 1):
-                                data_cluster[insert] += 1
-    print "cluster out: " + str(time.clock())
-    return data_cluster
-
-#Average together the results of the two runs (one from the "perspective" of each cell type)
-def cluster_average(cluster1, cluster2):
-    for interval in range(0, analysis_dist+1):
-        cluster1[interval] = (float(cluster1[interval]) + float(cluster2[interval]))/2
-    return cluster1
-
-#Make a simulated version of the cell distribution with random locations
-def sim_gen(sp_data, xmin, xmax, ybound_list):
-    sim_data = []
-    for cell in sp_data:
-        yrand = random.uniform(ybound_list[cell[3]-1][0], ybound_list[cell[3]-1][1])
-        sim_data.append([cell[0], random.uniform(xmin, xmax), yrand, cell[3]])
-    return sim_data
-
-#Modified version of boundaries function so as not to reset boundaries smaller in simulation runs
-#There is probably a better way to refactor all of the boundaries functions
-def sim_boundaries(sim_data, xmin, xmax, ymin, ymax):
-    for cell in sim_data:
-        xmin_dist = abs(cell[1] - xmin)
-        xmax_dist = abs(xmax - cell[1])
-        ymin_dist = abs(cell[2] - ymin)
-        ymax_dist = abs(ymax - cell[2])
-        cell.append(xmin_dist)
-        cell.append(xmax_dist)
-        cell.append(ymin_dist)
-        cell.append(ymax_dist)
-    return sim_data
-
-#This is the main function that runs simulations of cellular location
-def sim_iterate(sim_run_num, sp_data_mod, cell1, cell2, xmin, xmax, ymin, ymax, ybound_list):
-    sim_track = []
-    for unused in range(0, analysis_dist + 1):
-        sim_track.append(0)
-    for run_count in range(0, sim_run_num):
-        print "simulation run " + str(run_count + 1)
-        sim_raw = sim_boundaries(sim_gen(sp_data_mod, xmin, xmax, ybound_list), xmin, xmax, ymin, ymax)
-        if cell1 == cell2:
-            sim_cluster = cluster(sim_raw, cell1, cell1)
-        else:
-            sim_cluster = cluster_average(cluster(sim_raw, cell1, cell2), cluster(sim_raw, cell2, cell1))
-        for location in range(0, analysis_dist + 1):
-            sim_track[location] = sim_track[location] + sim_cluster[location]
-    for location in range(0, analysis_dist + 1):
-        sim_track[location] = sim_track[location] / sim_run_num
-    return sim_track
-
-#Use simulation output to correct density-correct clustering data
-def sim_correct(data_cluster, sim_cluster):
-    corrected_output = []
-    for unused in range(0, analysis_dist + 1):
-        corrected_output.append(0)
-    for location in range(0, analysis_dist + 1):
-        try:
-            corrected_output[location] = data_cluster[location] / sim_cluster[location]
-        except:
-            pass
-    return corrected_output
-
-sp_data = loadfile()
-sp_data_mod, xmin, xmax, ymin, ymax = boundaries(sp_data)
-
-print "data cluster run"
-if cell1 == cell2:
-    data_cluster = cluster(sp_data_mod, cell1, cell1)
-else:
-    data_cluster = cluster_average(cluster(sp_data_mod, cell1, cell2), cluster(sp_data_mod, cell2, cell1))
-print "data cluster values: "
-print data_cluster
-
-ybound_list = layer_ybound(sp_data_mod, ymin, ymax)
-sim_cluster = sim_iterate(sim_run_num, sp_data_mod, cell1, cell2, xmin, xmax, ymin, ymax, ybound_list)
-print "sim clustering value:"
-print sim_cluster
-
-sp_output = sim_correct(data_cluster, sim_cluster)
-print "output clustering value: "
-print sp_output
-
-print "run time: " + str(time.clock())
-
-#set up worksheet to write to
-book = xlwt.Workbook(encoding="utf-8")
-sheet1 = book.add_sheet("Python Sheet 1")
-
-##populate excel worksheet
-for location in range(0, analysis_dist + 1):
-    sheet1.write(0, location, (str(location) + " um"))
-    sheet1.write(1, location, sp_output[location])
-
-#save the spreadsheet
-savepath = directory + "\\" + outputfile + ".xls"
-book.save(savepath)
-
+import spatial_pattern
+
+config = spatial_pattern.AnalysisConfig(
+    null_model = "layered", layer_num = layer_num, cell1 = cell1, cell2 = cell2,
+    cell_types = cell_types, exclude_dist = exclude_dist, analysis_dist = analysis_dist,
+    interval_num = interval_num, min_dist = min_dist, bin_spacing = bin_spacing,
+    sim_run_num = sim_run_num, sim_tolerance = sim_tolerance, sim_min_runs = sim_min_runs,
+    engine = engine, sim_workers = sim_workers, sim_seed = sim_seed,
+    cache_directory = cache_directory, tile_size = tile_size,
+    sim_cache_directory = sim_cache_directory, sim_cache_size = sim_cache_size,
+    envelope_quantiles = envelope_quantiles, edge_correction = edge_correction,
+    instruments = [spatial_pattern.JsonLinesSink(instrument_file)] if instrument_file else None)
+
+if __name__ == "__main__":
+    spatial_pattern.check_output_format(config, output_format)
+    result = spatial_pattern.analyze_file(config, directory + "\\" + inputfile)
+    print "run time: " + str(time.clock())
+    spatial_pattern.save_output(config, directory + "\\" + outputfile + "." + output_format, result)
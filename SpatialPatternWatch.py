@@ -0,0 +1,85 @@
+##This program keeps running and analyzes every cell coordinate file that appears in a
+##directory, e.g. a share that the microscopy rigs export Stereo Investigator files to all day.
+##New files are picked up once they have been completely written, analyzed side by side on
+##a pool of worker processes, and saved to an output directory as with SpatialPatternBatch.py.
+##A status file per case shows whether it is queued, running, done or failed. Stop the
+##program with Ctrl+C; when it is started again, finished cases are not analyzed again, but a
+##file that was changed is.
+
+####################################################################
+##How to use this program
+
+##Unlike the other programs, this one needs Python 3.7 or newer (see Section 1 of
+##SpatialPatternRefactor.py for the addon libraries; install the versions for Python 3). Put
+##it in the same directory as the spatial_pattern folder.
+
+##Prepare the input files as described in Section 2 of SpatialPatternRefactor.py (layered
+##samples) or SpatialPattern_NoLayers.py (non-layered samples) and save or copy them into
+##watch_directory. Set your variables in the section below, and run this program. The
+##analysis settings are set here as well, because the other programs are written for
+##Python 2; see SpatialPatternRefactor.py for a full description of each of them.
+
+####################################################################
+##User set variables here
+
+#Directory that new input files (.txt) appear in
+watch_directory = r"C:\Users\John Morgan\Documents\sp_datafiles\incoming"
+
+#Directory that the results and status files of each case are written to
+output_directory = r"C:\Users\John Morgan\Documents\sp_datafiles\watch_output"
+
+#Format of the file saved for each case: "xls", "csv", "npz", "parquet" or "xlsx", as
+#output_format in SpatialPatternRefactor.py
+output_format = "xls"
+
+#Number of cases analyzed at the same time. 0 uses every core on the computer.
+workers = 0
+
+#Number of cases that can wait for a free worker. More files than this are left in
+#watch_directory and queued as workers free up. None allows twice the number of workers.
+queue_size = None
+
+#Seconds between two looks at watch_directory. A file is only taken on once it looks the
+#same twice in a row, so this is also how long a file has to be left alone before it is used.
+poll_interval = 10
+
+#Analysis settings: "layered" or "uniform" null model (SpatialPatternRefactor.py or
+#SpatialPattern_NoLayers.py), and the user set variables of those programs
+null_model = "layered"
+layer_num = 6
+cell1 = 1
+cell2 = 3
+cell_types = None
+exclude_dist = 100
+edge_correction = "exclude"
+analysis_dist = 100
+interval_num = 100
+min_dist = 0
+bin_spacing = "linear"
+sim_run_num = 200
+sim_tolerance = None
+sim_min_runs = 10
+engine = "python"
+sim_seed = None
+envelope_quantiles = None
+
+####################################################################
+##Program begins here
+
+import spatial_pattern
+from spatial_pattern.watch import watch_folder
+
+config = spatial_pattern.AnalysisConfig(
+    null_model = null_model, layer_num = layer_num, cell1 = cell1, cell2 = cell2,
+    cell_types = cell_types, exclude_dist = exclude_dist, analysis_dist = analysis_dist,
+    interval_num = interval_num, min_dist = min_dist, bin_spacing = bin_spacing,
+    sim_run_num = sim_run_num, sim_tolerance = sim_tolerance, sim_min_runs = sim_min_runs,
+    engine = engine, sim_seed = sim_seed, envelope_quantiles = envelope_quantiles,
+    edge_correction = edge_correction)
+
+if __name__ == "__main__":
+    try:
+        watch_folder(config, watch_directory, output_directory, workers, queue_size, poll_interval,
+                     output_format)
+    except KeyboardInterrupt:
+        print("stopped, run the program again to continue")
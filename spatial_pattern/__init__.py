@@ -0,0 +1,25 @@
+##Spatial pattern analysis (Morgan et al., 2012) as an importable package.
+##
+##SpatialPatternRefactor.py and SpatialPattern_NoLayers.py are the ready to run programs built
+##on this package. To use it from other code, put the analysis parameters in an
+##AnalysisConfig and pass it to the functions, e.g.
+##
+##    import spatial_pattern
+##    config = spatial_pattern.AnalysisConfig(cell1=1, cell2=3, null_model="layered", layer_num=6)
+##    result = spatial_pattern.analyze_file(config, "B4925.txt")
+##    print(result.sp_outputs[0])
+##
+##Importing the package does not run anything.
+##The watch folder service needs Python 3 and is imported on its own, from
+##spatial_pattern.watch (see SpatialPatternWatch.py).
+
+from spatial_pattern.analysis import AnalysisResult, analyze, analyze_array, analyze_file
+from spatial_pattern.batch import run_batch
+from spatial_pattern.benchmark import run_benchmarks
+from spatial_pattern.cellcache import load_cell_array, loadfile_cached
+from spatial_pattern.cellstore import CellStore, cell_store, column_store
+from spatial_pattern.config import AnalysisConfig
+from spatial_pattern.data import boundaries, layer_ybound, loadfile, roi_bounds, z_bounds
+from spatial_pattern.instrument import JsonLinesSink, LogSink, MemorySink
+from spatial_pattern.output import check_output_format, result_rows, save_output, write_results
+from spatial_pattern.tables import open_table, save_table
@@ -0,0 +1,176 @@
+##The whole analysis of one sample: clustering values of the real cells, the simulations,
+##and the density-corrected output
+
+from __future__ import division
+
+from spatial_pattern import simcache, tiled, vectorized
+from spatial_pattern.binning import g_curve, k_curve, l_curve
+from spatial_pattern.cellcache import load_cell_array
+from spatial_pattern.cellstore import cell_store, column_store
+from spatial_pattern.cluster import cluster_pairs, pair_label
+from spatial_pattern.data import iter_cells, layer_bands, layer_ybound, loadfile, roi_bounds, z_bounds
+from spatial_pattern.envelope import SimEnvelope
+from spatial_pattern.instrument import emit
+from spatial_pattern.progress import clock, report
+from spatial_pattern.simulate import sim_correct
+
+#Everything an analysis produces. All lists of values run over cell_pairs in the same order:
+#data_clusters are the clustering values of the real cells, sim_clusters the averaged
+#simulation values and sp_outputs the corrected clustering ratio (data / simulation).
+#sim_runs is the number of simulations used and sim_seed the seed they were run with.
+#envelopes holds an envelope.SimEnvelope per pair when config.envelope_quantiles is set,
+#otherwise it is None. k_curves, l_curves and g_curves are K(r), L(r) and g(r) of each pair
+#(see binning.py).
+class AnalysisResult(object):
+    def __init__(self, cell_pairs, data_clusters, sim_clusters, sp_outputs, sim_runs, sim_seed, envelopes=None,
+                 k_curves=None, l_curves=None, g_curves=None):
+        self.cell_pairs = cell_pairs
+        self.data_clusters = data_clusters
+        self.sim_clusters = sim_clusters
+        self.sp_outputs = sp_outputs
+        self.sim_runs = sim_runs
+        self.sim_seed = sim_seed
+        self.envelopes = envelopes
+        self.k_curves = k_curves
+        self.l_curves = l_curves
+        self.g_curves = g_curves
+
+#Run the whole analysis on cells already loaded with loadfile()
+def analyze(config, sp_data):
+    vectorized.require_numpy(config)
+    start = clock()
+    xmin, xmax, ymin, ymax = roi_bounds(sp_data)
+    zmin = zmax = None
+    if config.dimensions == 3:
+        zmin, zmax = z_bounds(sp_data)
+    emit(config, "boundaries", start, cells=len(sp_data))
+    if config.engine == "numpy":
+        sp_cells = vectorized.cell_columns(config, sp_data, xmin, xmax, ymin, ymax, zmin, zmax)
+    else:
+        sp_cells = cell_store(config, sp_data, xmin, xmax, ymin, ymax)
+    if config.null_model == "layered":
+        ybound_list = layer_ybound(config, sp_data, ymin, ymax)
+    else:
+        ybound_list = None
+    cell_layers = ((cell[0], cell[3]) for cell in sp_data)
+    return analyze_cells(config, sp_cells, cell_layers, xmin, xmax, ymin, ymax, ybound_list, zmin, zmax)
+
+#Run the whole analysis on cells in a structured array with the fields of cellcache.cell_dtype(),
+#e.g. from load_cell_array(). The fields go to the engines as columns, without making a list
+#for every cell.
+def analyze_array(config, cells):
+    vectorized.require_numpy(config)
+    start = clock()
+    cell_type, xloc, yloc, layer = cells["type"], cells["x"], cells["y"], cells["layer"]
+    xmin, xmax, ymin, ymax = vectorized.array_bounds(xloc, yloc)
+    zloc = zmin = zmax = None
+    if config.dimensions == 3:
+        zloc = cells["z"]
+        zmin, zmax = float(zloc.min()), float(zloc.max())
+    emit(config, "boundaries", start, cells=len(cells))
+    if config.engine == "numpy":
+        sp_cells = vectorized.array_columns(config, cell_type, xloc, yloc, layer, zloc, xmin, xmax, ymin, ymax,
+                                            zmin, zmax)
+    else:
+        sp_cells = column_store(config, cell_type.tolist(), xloc.tolist(), yloc.tolist(), layer.tolist(),
+                                xmin, xmax, ymin, ymax)
+    if config.null_model == "layered":
+        ybound_list = vectorized.layer_ybound_np(config, layer, yloc, ymin, ymax)
+    else:
+        ybound_list = None
+    cell_layers = zip(cell_type.tolist(), layer.tolist())
+    return analyze_cells(config, sp_cells, cell_layers, xmin, xmax, ymin, ymax, ybound_list, zmin, zmax)
+
+#The analysis from the cell store or columns of analyze() and analyze_array() on: the data
+#clustering values, the simulations and the density correction. cell_layers holds the
+#(cell type, layer) pairs for simcache.null_key().
+def analyze_cells(config, sp_cells, cell_layers, xmin, xmax, ymin, ymax, ybound_list, zmin=None, zmax=None):
+    cell_pairs = config.cell_pairs()
+
+    report(config, "data cluster run")
+    data_clusters = cluster_pairs(config, sp_cells, cell_pairs)
+    report_clusters(config, cell_pairs, data_clusters)
+    envelopes = pair_envelopes(config, data_clusters)
+
+    null_key = None
+    if config.sim_cache_directory is not None:
+        zbounds = None if zmin is None else [zmin, zmax]
+        null_key = simcache.null_key(config, cell_layers, cell_pairs, xmin, xmax, ymin, ymax, ybound_list,
+                                    zbounds)
+    if config.null_model == "layered" and config.engine == "numpy":
+        #worked out once here instead of in every simulation run
+        ybound_list = vectorized.layer_geometry(config, sp_cells, ybound_list)
+    sim_clusters, sim_runs, sim_seed = simcache.sim_iterate_cached(config, null_key, sp_cells, cell_pairs,
+                                                                   xmin, xmax, ymin, ymax, ybound_list,
+                                                                   envelopes=envelopes)
+    return correct_clusters(config, cell_pairs, data_clusters, sim_clusters, sim_runs, sim_seed, envelopes)
+
+#Run the whole analysis on one input file in tiled mode (see tiled.py). The file is streamed
+#instead of loaded, so memory use depends on tile_size rather than on the number of cells.
+def analyze_tiled(config, path):
+    vectorized.require_numpy(config)
+    start = clock()
+    xmin, xmax, ymin, ymax, extremes = tiled.scan_file(config, path)
+    emit(config, "boundaries", start, path=path)
+    cell_pairs = config.cell_pairs()
+
+    report(config, "data cluster run (tiles of " + str(config.tile_size) + ")")
+    data_clusters = tiled.tile_pass(config, iter_cells(config, path), cell_pairs, xmin, xmax, ymin, ymax)
+    report_clusters(config, cell_pairs, data_clusters)
+    envelopes = pair_envelopes(config, data_clusters)
+
+    if config.null_model == "layered":
+        ybound_list = layer_bands(config, extremes, ymax)
+    else:
+        ybound_list = None
+    null_key = None
+    if config.sim_cache_directory is not None:
+        cell_layers = ((cell[0], cell[3]) for cell in iter_cells(config, path))
+        null_key = simcache.null_key(config, cell_layers, cell_pairs, xmin, xmax, ymin, ymax, ybound_list)
+    sim_clusters, sim_runs, sim_seed = simcache.sim_iterate_cached(config, null_key, path, cell_pairs,
+                                                                   xmin, xmax, ymin, ymax, ybound_list,
+                                                                   tiled.sim_run_tiled, envelopes)
+    return correct_clusters(config, cell_pairs, data_clusters, sim_clusters, sim_runs, sim_seed, envelopes)
+
+#Print the data clustering values of each pair
+def report_clusters(config, cell_pairs, data_clusters):
+    for pair_num in range(0, len(cell_pairs)):
+        report(config, pair_label(cell_pairs[pair_num]) + " data cluster values: ")
+        report(config, data_clusters[pair_num])
+
+#One SimEnvelope per pair when config.envelope_quantiles is set, otherwise None
+def pair_envelopes(config, data_clusters):
+    if config.envelope_quantiles is None:
+        return None
+    return [SimEnvelope(config, data_cluster) for data_cluster in data_clusters]
+
+#Density-correct the clustering values with the averaged simulations
+def correct_clusters(config, cell_pairs, data_clusters, sim_clusters, sim_runs, sim_seed, envelopes=None):
+    sp_outputs = []
+    for pair_num in range(0, len(cell_pairs)):
+        report(config, pair_label(cell_pairs[pair_num]) + " sim clustering value:")
+        report(config, sim_clusters[pair_num])
+        sp_outputs.append(sim_correct(data_clusters[pair_num], sim_clusters[pair_num]))
+        report(config, pair_label(cell_pairs[pair_num]) + " output clustering value: ")
+        report(config, sp_outputs[pair_num])
+        if envelopes:
+            envelope = envelopes[pair_num]
+            envelope.finish(sim_clusters[pair_num])
+            report(config, pair_label(cell_pairs[pair_num]) + " simulation envelope (low, high): ")
+            report(config, envelope.ratio_low)
+            report(config, envelope.ratio_high)
+            report(config, pair_label(cell_pairs[pair_num]) + " global test p-value: " + str(envelope.global_p))
+    k_curves = [k_curve(config, sp_output) for sp_output in sp_outputs]
+    l_curves = [l_curve(config, sp_output) for sp_output in sp_outputs]
+    g_curves = [g_curve(data_clusters[pair_num], sim_clusters[pair_num]) for pair_num in range(0, len(cell_pairs))]
+    return AnalysisResult(cell_pairs, data_clusters, sim_clusters, sp_outputs, sim_runs, sim_seed, envelopes,
+                          k_curves, l_curves, g_curves)
+
+#Run the whole analysis on one input file
+#With tile_size set the file is analyzed in tiled mode; the binary cache is not used then.
+def analyze_file(config, path):
+    if config.tile_size is not None:
+        return analyze_tiled(config, path)
+    if config.cache_directory is not None:
+        return analyze_array(config, load_cell_array(config, path, config.cache_directory))
+    return analyze(config, loadfile(config, path))
@@ -0,0 +1,147 @@
+##Running the analysis on many input files, side by side on a pool of worker processes.
+##Each case is saved as soon as it is done, so a stopped batch can be resumed.
+
+from __future__ import print_function
+
+import csv
+import multiprocessing
+import os
+import time
+import traceback
+
+from spatial_pattern.analysis import analyze_file
+from spatial_pattern.binning import edge_labels
+from spatial_pattern.output import check_output_format, open_csv, save_output, write_results
+from spatial_pattern.tables import TABLE_FORMATS, open_table
+
+#List the cases to run as [input file name, output name] pairs. With a manifest (a text file
+#in batch_directory with one input file name per line, and optionally a tab and the output
+#name) the cases are read from it; otherwise every .txt file in batch_directory is a case.
+def batch_cases(batch_directory, manifest=None, summary_file=None):
+    cases = []
+    if manifest is None:
+        for file_name in sorted(os.listdir(batch_directory)):
+            if file_name.lower().endswith(".txt") and file_name != summary_file:
+                cases.append([file_name, os.path.splitext(file_name)[0]])
+        return cases
+    manifest_obj = open(os.path.join(batch_directory, manifest), "r")
+    try:
+        for line in csv.reader(manifest_obj, dialect = csv.excel_tab):
+            if not line or not line[0].strip() or line[0].startswith("#"):
+                continue
+            if len(line) > 1 and line[1].strip():
+                cases.append([line[0].strip(), line[1].strip()])
+            else:
+                cases.append([line[0].strip(), os.path.splitext(line[0].strip())[0]])
+    finally:
+        manifest_obj.close()
+    return cases
+
+#A case is complete once its results file exists. The file is only put in place after the
+#case has been fully analyzed and saved, so a crash can never leave a half written one.
+def case_results_path(output_directory, output_name):
+    return os.path.join(output_directory, output_name + "_results.txt")
+
+def case_done(output_directory, output_name):
+    return os.path.exists(case_results_path(output_directory, output_name))
+
+#Analyze one case. Returns the case and None when it worked, or the case and the error
+#message when it failed; a failed case is not marked as done, so it is tried again on the
+#next run.
+def run_case(case, config, batch_directory, output_directory, output_format="xls"):
+    input_name, output_name = case
+    try:
+        result = analyze_file(config, os.path.join(batch_directory, input_name))
+        save_output(config, os.path.join(output_directory, output_name + "." + output_format), result)
+        results_path = case_results_path(output_directory, output_name)
+        write_results(config, results_path + ".tmp", result)
+        if os.path.exists(results_path):
+            os.remove(results_path)
+        os.rename(results_path + ".tmp", results_path)
+        return case, None
+    except Exception:
+        return case, traceback.format_exc()
+
+#Worker process side of the case pool; the settings are handed over once per worker
+def batch_worker_init(*batch_args):
+    global batch_worker_args
+    batch_worker_args = batch_args
+
+def batch_worker_run(case):
+    return run_case(case, *batch_worker_args)
+
+#Rows of the results file of a completed case, without the header row
+def case_rows(output_directory, output_name):
+    results_obj = open_csv(case_results_path(output_directory, output_name), "r")
+    try:
+        rows = list(csv.reader(results_obj, dialect = csv.excel_tab))
+    finally:
+        results_obj.close()
+    return rows[1:]
+
+#Combine the results of every completed case into one summary table. A summary_file ending in
+#.csv, .npz, .parquet or .xlsx is written as a columnar table (see tables.py), otherwise as a
+#tab-delimited text file. Either way the cases are read and written one at a time.
+def write_summary(config, cases, output_directory, summary_file):
+    if os.path.splitext(summary_file)[1].lower() in TABLE_FORMATS:
+        table = open_table(os.path.join(output_directory, summary_file), edge_labels(config))
+        try:
+            for input_name, output_name in cases:
+                if case_done(output_directory, output_name):
+                    table.write_case(output_name, [(row[0], row[1:]) for row in case_rows(output_directory, output_name)])
+        finally:
+            table.close()
+        return
+    summary_obj = open_csv(os.path.join(output_directory, summary_file), "w")
+    try:
+        csv_write = csv.writer(summary_obj, dialect = csv.excel_tab)
+        header_written = False
+        for input_name, output_name in cases:
+            if not case_done(output_directory, output_name):
+                continue
+            if not header_written:
+                csv_write.writerow(["case", "cells"] + edge_labels(config))
+                header_written = True
+            for row in case_rows(output_directory, output_name):
+                csv_write.writerow([output_name] + row)
+    finally:
+        summary_obj.close()
+
+#Run every case that is not done yet on case_workers processes (0 uses every core) and write
+#the summary. Inside a batch the simulations of each case run in the case's own process.
+#Each case is saved as output_name + "." + output_format, an extension that save_output()
+#takes. Returns the list of cases that failed.
+def run_batch(config, batch_directory, output_directory, manifest=None,
+              summary_file="batch_summary.txt", case_workers=0, output_format="xls"):
+    check_output_format(config, output_format)
+    config = config.copy(sim_workers=1)
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+    cases = batch_cases(batch_directory, manifest, summary_file)
+    todo = []
+    for case in cases:
+        if case_done(output_directory, case[1]):
+            print("already done: " + case[0])
+        else:
+            todo.append(case)
+    print(str(len(todo)) + " of " + str(len(cases)) + " cases to run")
+
+    failed = []
+    start_time = time.time()
+    pool = multiprocessing.Pool(case_workers or None, batch_worker_init,
+                                (config, batch_directory, output_directory, output_format))
+    try:
+        for case, error in pool.imap_unordered(batch_worker_run, todo):
+            if error is None:
+                print("case done: " + case[0] + " (" + str(int(time.time() - start_time)) + " s)")
+            else:
+                print("case failed: " + case[0])
+                print(error)
+                failed.append(case)
+        pool.close()
+    finally:
+        pool.terminate()
+
+    write_summary(config, cases, output_directory, summary_file)
+    print("summary written to " + os.path.join(output_directory, summary_file))
+    return failed
@@ -0,0 +1,246 @@
+##Benchmarks of the analysis stages: loading, boundaries, building the cell store (the seed
+##test of every cell), clustering, generating one simulated distribution and the full
+##simulation loop. They are run on the bundled B4925
+##sample files and on synthetic samples of growing size, and give the time, throughput and
+##peak memory of each stage, plus how the time grows with the number of cells (the scaling
+##exponent: 1 means twice the cells take twice as long, 2 means four times as long).
+##Results are saved as JSON and can be compared against an earlier run to catch slowdowns.
+##See SpatialPatternBenchmark.py for the ready to run program.
+
+from __future__ import division
+
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+
+from spatial_pattern import vectorized
+from spatial_pattern.cellstore import cell_store
+from spatial_pattern.cluster import cluster_pairs
+from spatial_pattern.data import layer_ybound, loadfile, roi_bounds
+from spatial_pattern.progress import clock, report
+from spatial_pattern.simulate import sim_gen, sim_gen_uniform, sim_iterate, sim_random
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+LAYOUTS = ("uniform", "clustered")
+STAGES = ("load", "boundaries", "cell_store", "cluster", "sim_gen", "sim_iterate")
+
+#Synthetic samples have the cell density of B4925.txt: one cell per 1540 square um
+SYNTHETIC_AREA_PER_CELL = 1540.
+SYNTHETIC_LAYERS = 6
+
+#Write a synthetic sample in the input file format (type, x, y, layer), with cell types 1
+#and 3 in equal numbers on a square ROI. "uniform" places cells completely at random;
+#"clustered" places them in small groups around random centers (a Thomas process). The
+#ROI is cut into SYNTHETIC_LAYERS horizontal layers of equal height, layer 1 at the top.
+def write_synthetic(path, layout, cell_total, seed):
+    rng = random.Random(seed)
+    side = math.sqrt(cell_total * SYNTHETIC_AREA_PER_CELL)
+    centers = []
+    for unused in range(0, max(cell_total // 20, 1)):
+        centers.append((rng.uniform(0, side), rng.uniform(0, side)))
+    output_obj = open(path, "w")
+    try:
+        output_obj.write("type\tx\ty\tlayer\n")
+        for cell_num in range(0, cell_total):
+            if layout == "uniform":
+                xloc, yloc = rng.uniform(0, side), rng.uniform(0, side)
+            else:
+                center = rng.choice(centers)
+                xloc = min(max(rng.gauss(center[0], 30.), 0.), side)
+                yloc = min(max(rng.gauss(center[1], 30.), 0.), side)
+            layer = min(int((side - yloc) / side * SYNTHETIC_LAYERS) + 1, SYNTHETIC_LAYERS)
+            output_obj.write("%d\t%.2f\t%.2f\t%d\n" % (1 + 2 * (cell_num % 2), xloc, yloc, layer))
+    finally:
+        output_obj.close()
+
+#Time one stage, run() being the timed part. Returns the fastest time and the output of the
+#last run.
+def time_stage(run, repeats):
+    best = None
+    for unused in range(0, repeats):
+        start = clock()
+        output = run()
+        elapsed = clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, output
+
+#Peak memory in bytes allocated while one stage runs, or None when tracemalloc is not
+#available (Python 2). Measured in a separate run because tracing slows everything down.
+def stage_memory(run):
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+#Run every stage on one input file. sim_runs simulations are used for the sim_iterate
+#stage. Returns a list of results, one dictionary per stage.
+def bench_file(config, path, dataset, repeats, sim_runs, measure_memory):
+    quiet = config.copy(verbose=False, sim_run_num=sim_runs, sim_tolerance=None, sim_workers=1,
+                        sim_seed=1, envelope_quantiles=None, sim_cache_directory=None)
+    cell_pairs = quiet.cell_pairs()
+    sp_data = loadfile(quiet, path)
+    xmin, xmax, ymin, ymax = roi_bounds(sp_data)
+
+    #the cells as the engine keeps them, with the seed test (and edge weights) of each cell
+    def build_cells():
+        if quiet.engine == "numpy":
+            return vectorized.cell_columns(quiet, sp_data, xmin, xmax, ymin, ymax)
+        return cell_store(quiet, sp_data, xmin, xmax, ymin, ymax)
+    sp_cells = build_cells()
+    ybound_list = None
+    if quiet.null_model == "layered":
+        ybound_list = layer_ybound(quiet, sp_data, ymin, ymax)
+        if quiet.engine == "numpy":
+            ybound_list = vectorized.layer_geometry(quiet, sp_cells, ybound_list)
+
+    def gen_one():
+        rng = sim_random(quiet, 1, 0)
+        if quiet.engine == "numpy":
+            if quiet.null_model == "layered":
+                return vectorized.sim_gen_np(quiet, sp_cells, xmin, xmax, ymin, ymax, ybound_list, rng)
+            return vectorized.sim_gen_uniform_np(quiet, sp_cells, xmin, xmax, ymin, ymax, rng)
+        if quiet.null_model == "layered":
+            return sim_gen(quiet, sp_cells, xmin, xmax, ymin, ymax, ybound_list, rng)
+        return sim_gen_uniform(quiet, sp_cells, xmin, xmax, ymin, ymax, rng)
+    #(stage, run, throughput unit)
+    stages = [("load", lambda: loadfile(quiet, path), "cells/s"),
+              ("boundaries", lambda: roi_bounds(sp_data), "cells/s"),
+              ("cell_store", build_cells, "cells/s"),
+              ("cluster", lambda: cluster_pairs(quiet, sp_cells, cell_pairs), "pairs/s"),
+              ("sim_gen", gen_one, "cells/s"),
+              ("sim_iterate", lambda: sim_iterate(quiet, sp_cells, cell_pairs, xmin, xmax, ymin, ymax, ybound_list),
+               "sims/s")]
+
+    results = []
+    for stage, run, unit in stages:
+        seconds, output = time_stage(run, repeats)
+        if unit == "pairs/s":
+            amount = sum([data_cluster[-1] for data_cluster in output])
+        elif unit == "sims/s":
+            amount = output[1]
+        else:
+            amount = len(sp_data)
+        peak_memory = None
+        if measure_memory:
+            peak_memory = stage_memory(run)
+        result = {"dataset": dataset, "cells": len(sp_data), "stage": stage, "seconds": seconds,
+                  "throughput": amount / seconds if seconds > 0 else None, "unit": unit,
+                  "peak_memory": peak_memory}
+        results.append(result)
+        report(config, stage_line(result))
+    return results
+
+#One line of printed benchmark output
+def stage_line(result):
+    line = result["dataset"] + " " + result["stage"] + ": " + ("%.4f" % result["seconds"]) + " s"
+    if result["throughput"] is not None:
+        line += ", " + ("%.4g" % result["throughput"]) + " " + result["unit"]
+    if result["peak_memory"] is not None:
+        line += ", peak memory " + ("%.1f" % (result["peak_memory"] / 1048576.)) + " MB"
+    return line
+
+#Least squares slope of log(seconds) against log(cells) over the sizes of one layout
+def scaling_exponent(cells, seconds):
+    points = [(math.log(cell_total), math.log(elapsed)) for cell_total, elapsed in zip(cells, seconds) if elapsed > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum([point[0] for point in points]) / len(points)
+    mean_y = sum([point[1] for point in points]) / len(points)
+    spread = sum([(point[0] - mean_x)**2 for point in points])
+    if spread == 0:
+        return None
+    return sum([(point[0] - mean_x) * (point[1] - mean_y) for point in points]) / spread
+
+#Compare results against a baseline saved by an earlier run. A stage is a regression when it
+#takes more than (1 + tolerance) times as long as in the baseline. Returns a description of
+#each regression.
+def compare_baseline(results, baseline, tolerance):
+    baseline_seconds = {}
+    for result in baseline["results"]:
+        baseline_seconds[(result["dataset"], result["stage"])] = result["seconds"]
+    regressions = []
+    for result in results:
+        before = baseline_seconds.get((result["dataset"], result["stage"]))
+        if before and result["seconds"] > before * (1 + tolerance):
+            regressions.append(result["dataset"] + " " + result["stage"] + ": " + ("%.4f" % result["seconds"]) +
+                               " s, baseline " + ("%.4f" % before) + " s (" + ("%+.0f" % ((result["seconds"] / before - 1) * 100)) + "%)")
+    return regressions
+
+#Run the whole benchmark suite and save it as JSON to output_path.
+#data_directory holds B4925.txt and NoLayer_B4925.txt; the bundled files are run with the
+#"layered" and "uniform" null model respectively, synthetic samples with config's.
+#sizes are the cell numbers of the synthetic samples for each of layouts.
+#With baseline_path set, the results are compared against that earlier output; returns the
+#list of regressions (empty without a baseline).
+def run_benchmarks(config, data_directory, output_path, sizes=(1000, 10000, 100000, 1000000), layouts=LAYOUTS,
+                   repeats=3, sim_runs=3, measure_memory=True, baseline_path=None, tolerance=0.25):
+    vectorized.require_numpy(config)
+    #read the baseline first, output_path may be the same file
+    baseline = None
+    if baseline_path is not None:
+        baseline_obj = open(baseline_path, "r")
+        try:
+            baseline = json.load(baseline_obj)
+        finally:
+            baseline_obj.close()
+    results = []
+    for file_name, null_model in (("B4925.txt", "layered"), ("NoLayer_B4925.txt", "uniform")):
+        path = os.path.join(data_directory, file_name)
+        if os.path.exists(path):
+            results.extend(bench_file(config.copy(null_model=null_model, layer_num=6), path, file_name,
+                                      repeats, sim_runs, measure_memory))
+        else:
+            report(config, file_name + " not found in " + data_directory + ", skipped")
+    synthetic_config = config.copy(layer_num=SYNTHETIC_LAYERS, cell1=1, cell2=3, cell_types=None)
+    scaling = {}
+    synthetic_directory = tempfile.mkdtemp(prefix="spatial_pattern_bench_")
+    try:
+        for layout in layouts:
+            layout_results = []
+            for cell_total in sizes:
+                path = os.path.join(synthetic_directory, layout + "_" + str(cell_total) + ".txt")
+                write_synthetic(path, layout, cell_total, cell_total)
+                layout_results.extend(bench_file(synthetic_config, path, layout + " " + str(cell_total),
+                                                 repeats, sim_runs, measure_memory))
+                os.remove(path)
+            scaling[layout] = {}
+            for stage in STAGES:
+                stage_results = [result for result in layout_results if result["stage"] == stage]
+                scaling[layout][stage] = scaling_exponent([result["cells"] for result in stage_results],
+                                                          [result["seconds"] for result in stage_results])
+                if scaling[layout][stage] is not None:
+                    report(config, layout + " " + stage + " scaling exponent: " + ("%.2f" % scaling[layout][stage]))
+            results.extend(layout_results)
+    finally:
+        shutil.rmtree(synthetic_directory, True)
+
+    benchmark = {"python": platform.python_version(), "platform": platform.platform(),
+                 "engine": config.engine, "null_model": config.null_model, "analysis_dist": config.analysis_dist,
+                 "sim_runs": sim_runs, "repeats": repeats, "results": results, "scaling": scaling}
+    output_obj = open(output_path, "w")
+    try:
+        json.dump(benchmark, output_obj, indent=1, sort_keys=True)
+    finally:
+        output_obj.close()
+
+    regressions = []
+    if baseline is not None:
+        if baseline.get("engine") != config.engine:
+            report(config, "baseline was run with engine " + repr(baseline.get("engine")) + ", not " + repr(config.engine))
+        regressions = compare_baseline(results, baseline, tolerance)
+        for regression in regressions:
+            report(config, "slower than baseline: " + regression)
+    return regressions
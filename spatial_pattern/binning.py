@@ -0,0 +1,70 @@
+##Distance bins, and the curves worked out from the binned pair counts.
+##
+##The distances from min_dist to analysis_dist are cut into interval_num bins, evenly spaced
+##("linear") or evenly spaced on a log scale ("log", for fine bins at short distances and
+##coarse ones further out). Position 0 of a curve holds the pairs up to min_dist and
+##position p the pairs up to the end of bin p, so every curve has interval_num + 1 positions.
+##A pair is put in its bin by a binary search of the bin edges, so the time per pair barely
+##depends on the number of bins, and both engines search the same edges and give the same bins.
+##
+##From the clustering values of the data and the averaged simulations come three curves,
+##all relative to the null model (the simulations take the place of complete spatial
+##randomness, as in the clustering ratio):
+##  K(r)   Ripley's K, scaled so that the null model gives pi * r^2, or 4/3 * pi * r^3 in 3D
+##  L(r)   sqrt(K(r) / pi), or the cube root of K(r) / (4/3 * pi) in 3D, which the null model
+##         gives as r
+##  g(r)   pair correlation: the pairs in each bin over the simulated pairs in that bin
+
+from __future__ import division
+
+import math
+
+#Upper edge of each position of the curves: min_dist, then the end of each bin. The last
+#edge is exactly analysis_dist, so every pair within analysis_dist has a bin.
+def bin_edges(config):
+    min_dist, analysis_dist, interval_num = config.min_dist, config.analysis_dist, config.interval_num
+    edges = []
+    for bin_num in range(0, interval_num + 1):
+        if config.bin_spacing == "log":
+            edges.append(min_dist * (analysis_dist / min_dist) ** (bin_num / interval_num))
+        else:
+            edges.append(min_dist + (analysis_dist - min_dist) * bin_num / interval_num)
+    edges[0] = float(min_dist)
+    edges[-1] = float(analysis_dist)
+    return edges
+
+#Label of each position in saved output, e.g. "25 um"
+def edge_labels(config):
+    return ["%g um" % edge for edge in bin_edges(config)]
+
+#Pair counts in each bin from a cumulative clustering curve
+def bin_counts(cluster):
+    counts = []
+    previous = 0
+    for value in cluster:
+        counts.append(value - previous)
+        previous = value
+    return counts
+
+#K(r) at each edge from the output clustering value (data / averaged simulation)
+def k_curve(config, sp_output):
+    if config.dimensions == 3:
+        return [4 / 3 * math.pi * edge**3 * ratio for edge, ratio in zip(bin_edges(config), sp_output)]
+    return [math.pi * edge**2 * ratio for edge, ratio in zip(bin_edges(config), sp_output)]
+
+#L(r) at each edge from the output clustering value
+def l_curve(config, sp_output):
+    if config.dimensions == 3:
+        return [edge * max(ratio, 0) ** (1 / 3) for edge, ratio in zip(bin_edges(config), sp_output)]
+    return [edge * math.sqrt(max(ratio, 0)) for edge, ratio in zip(bin_edges(config), sp_output)]
+
+#g(r) of each bin from the data clustering values and the averaged simulation. Bins where
+#the simulations found no pairs are left at 0, as in sim_correct().
+def g_curve(data_cluster, sim_cluster):
+    g_values = []
+    for data_count, sim_count in zip(bin_counts(data_cluster), bin_counts(sim_cluster)):
+        if sim_count > 0:
+            g_values.append(data_count / sim_count)
+        else:
+            g_values.append(0.)
+    return g_values
@@ -0,0 +1,112 @@
+##Binary cache of parsed cell coordinate files. Each text file is converted once into a
+##numpy .npy file of cell columns (type, x, y, layer, and z in 3D), named after the SHA-1 hash of the text
+##file. Later loads memory-map the .npy file instead of parsing the text again, and a changed
+##text file gets a new hash and is converted again automatically. Needs the numpy library.
+
+import hashlib
+import os
+
+from spatial_pattern.data import loadfile
+from spatial_pattern.instrument import emit
+from spatial_pattern.progress import clock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CELL_DTYPE = [("type", "<i8"), ("x", "<f8"), ("y", "<f8"), ("layer", "<i8")]
+
+#Fields of the cached array: CELL_DTYPE, plus z with dimensions = 3
+def cell_dtype(config):
+    if config.dimensions == 3:
+        return CELL_DTYPE + [("z", "<f8")]
+    return CELL_DTYPE
+
+#Part of the cache file name that decides how the columns are read (see loadfile)
+def read_mode(config):
+    if config.dimensions == 3:
+        return config.null_model + "3d"
+    return config.null_model
+
+#SHA-1 hash of a file's contents, read in blocks so large files are not held in memory
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    input_file_obj = open(path, "rb")
+    try:
+        block = input_file_obj.read(block_size)
+        while block:
+            digest.update(block)
+            block = input_file_obj.read(block_size)
+    finally:
+        input_file_obj.close()
+    return digest.hexdigest()
+
+#Start of the names of the cache files of a text file: its name, a hash of its absolute path,
+#so that files with the same name in different directories keep their own cache files, and
+#read_mode(), because the null model and dimensions decide how the columns are read (see loadfile)
+def cache_prefix(config, path):
+    source = os.path.abspath(path)
+    if not isinstance(source, bytes):
+        source = source.encode("utf-8")
+    return os.path.basename(path) + "." + hashlib.sha1(source).hexdigest()[:12] + "." + read_mode(config) + "."
+
+#Cache file for one version of a text file
+def cache_path(config, path, cache_directory, source_hash):
+    return os.path.join(cache_directory, cache_prefix(config, path) + source_hash + ".npy")
+
+#Convert a text file into a structured array with cell_dtype() fields and save it to
+#cache_file. The values come from loadfile(), so they are exactly the ones the text gives.
+#The array is written under a temporary name and then renamed, so that a crash or a second
+#process converting the same file never leaves a half written cache file behind.
+def convert_file(config, path, cache_file):
+    sp_data = loadfile(config, path)
+    fields = cell_dtype(config)
+    cells = numpy.zeros(len(sp_data), dtype=fields)
+    for field in range(0, len(fields)):
+        cells[fields[field][0]] = [cell[field] for cell in sp_data]
+    temp_file = cache_file + "." + str(os.getpid()) + ".tmp"
+    temp_obj = open(temp_file, "wb")
+    try:
+        numpy.save(temp_obj, cells)
+    finally:
+        temp_obj.close()
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    os.rename(temp_file, cache_file)
+
+#Remove cache files left from earlier versions of the same text file (same name and directory)
+def remove_stale(config, path, cache_directory, cache_file):
+    prefix = cache_prefix(config, path)
+    for file_name in os.listdir(cache_directory):
+        if file_name.startswith(prefix) and file_name.endswith(".npy"):
+            stale_file = os.path.join(cache_directory, file_name)
+            if stale_file != cache_file:
+                try:
+                    os.remove(stale_file)
+                except OSError:
+                    #still open in another process; it will go on a later conversion
+                    pass
+
+#Load the cells of a text file as a read-only, memory-mapped structured array with fields
+#type, x, y and layer (and z in 3D), converting the file first if it has no up to date cache entry.
+#The columns (e.g. cells["x"]) are views of the file, nothing is copied; analysis.analyze_array()
+#hands them to the engines as they are.
+def load_cell_array(config, path, cache_directory):
+    start = clock()
+    if numpy is None:
+        raise ImportError("the cell cache needs the numpy library")
+    if not os.path.isdir(cache_directory):
+        os.makedirs(cache_directory)
+    cache_file = cache_path(config, path, cache_directory, file_hash(path))
+    if not os.path.exists(cache_file):
+        convert_file(config, path, cache_file)
+        remove_stale(config, path, cache_directory, cache_file)
+    cells = numpy.load(cache_file, mmap_mode="r")
+    emit(config, "loadfile", start, path=path, cells=len(cells), cached=True)
+    return cells
+
+#Cached version of loadfile(): the same list of cells, read from the binary cache. Use
+#load_cell_array() with analysis.analyze_array() to skip making a list for every cell.
+def loadfile_cached(config, path, cache_directory):
+    return [list(cell) for cell in load_cell_array(config, path, cache_directory).tolist()]
@@ -0,0 +1,80 @@
+##Compact cell storage for the "python" engine. Instead of a list per cell, the cells are kept
+##as a structure of arrays: the coordinates in array("d") columns, split by cell type when the
+##store is built, and the seed test of each cell (see edge.seed_weights) worked out once
+##and kept in a bytearray next to them. A cell then takes a few dozen bytes instead of a
+##few hundred, the clustering loops only visit the cells of the types they compare, and a
+##simulation run fills new columns instead of making a list for every cell.
+##
+##The cell types and layers are also kept in file order, so that the simulations can draw
+##their random numbers in the same order as before.
+
+from array import array
+
+from spatial_pattern.edge import bin_radii, seed_weights
+
+#The cells of one cell type. Position i of each column belongs to the same cell; seed[i] is
+#1 when the cell can be a seed and weights[i] holds the edge weights of its pairs by bin
+#(shared unit weights when no correction is needed, see edge.seed_weights).
+class CellGroup(object):
+    def __init__(self):
+        self.xloc = array("d")
+        self.yloc = array("d")
+        self.seed = bytearray()
+        self.weights = []
+
+    def __len__(self):
+        return len(self.xloc)
+
+#All cells of one sample or simulation, within the ROI (xmin, xmax, ymin, ymax)
+class CellStore(object):
+    def __init__(self, config, xmin, xmax, ymin, ymax):
+        self.config = config
+        self.bounds = (xmin, xmax, ymin, ymax)
+        self.cell_type = array("l")
+        self.layer = array("l")
+        self.groups = {}
+        self.radii = bin_radii(config)
+        self.unit_weights = [1] * len(self.radii)
+
+    def __len__(self):
+        return len(self.cell_type)
+
+    #Add one cell. Halo cells of the tiled mode (owned False) are never seeds and are only
+    #counted as partners of the cells the tile owns.
+    def add(self, cell_type, xloc, yloc, layer, owned=True):
+        self.cell_type.append(cell_type)
+        self.layer.append(layer)
+        group = self.groups.get(cell_type)
+        if group is None:
+            group = self.groups[cell_type] = CellGroup()
+        group.xloc.append(xloc)
+        group.yloc.append(yloc)
+        if owned:
+            xmin, xmax, ymin, ymax = self.bounds
+            edge_dists = (abs(xloc - xmin), abs(xmax - xloc), abs(yloc - ymin), abs(ymax - yloc))
+            seed_ok, weights = seed_weights(self.config, edge_dists, self.radii, self.unit_weights)
+        else:
+            seed_ok, weights = False, self.unit_weights
+        group.seed.append(int(seed_ok))
+        group.weights.append(weights)
+
+    #The cells of one type; an empty group when the sample has none
+    def group(self, cell_type):
+        return self.groups.get(cell_type) or CellGroup()
+
+#Build a store from cells in the loadfile() format. owned, if given, holds the owned flag of
+#each cell (see tiled.read_tile).
+def cell_store(config, sp_data, xmin, xmax, ymin, ymax, owned=None):
+    store = CellStore(config, xmin, xmax, ymin, ymax)
+    for cell_num in range(0, len(sp_data)):
+        cell = sp_data[cell_num]
+        store.add(cell[0], cell[1], cell[2], cell[3], owned is None or owned[cell_num])
+    return store
+
+#Build a store from cell columns (any sequences of equal length), e.g. the fields of a cached
+#cell array (see cellcache.py)
+def column_store(config, cell_type, xloc, yloc, layer, xmin, xmax, ymin, ymax):
+    store = CellStore(config, xmin, xmax, ymin, ymax)
+    for cell in zip(cell_type, xloc, yloc, layer):
+        store.add(*cell)
+    return store
@@ -0,0 +1,262 @@
+##Clustering values: counts of cell pairs at each distance (pure Python engine), and the
+##functions that pick the engine and combine the two "perspectives" of a cell pair.
+
+from __future__ import division
+
+import math
+from bisect import bisect_left
+
+from spatial_pattern import vectorized
+from spatial_pattern.binning import bin_edges
+from spatial_pattern.instrument import emit
+from spatial_pattern.progress import clock, report
+
+#Bucket the cells of a cellstore.CellGroup (or the members positions of it) into a square
+#grid whose buckets are analysis_dist wide. Buckets hold the positions of their cells in the
+#group's columns.
+#Every cell within analysis_dist of a point then lies in that point's bucket or one of
+#the eight buckets around it, so the neighbor search no longer scans the whole sample.
+def grid_index(config, group, members=None):
+    analysis_dist = config.analysis_dist
+    xloc, yloc = group.xloc, group.yloc
+    if members is None:
+        members = range(0, len(group))
+    grid = {}
+    for position in members:
+        key = (int(math.floor(xloc[position] / analysis_dist)), int(math.floor(yloc[position] / analysis_dist)))
+        grid.setdefault(key, []).append(position)
+    return grid
+
+#Return the positions of the cells in the grid buckets that overlap the analysis range
+#around (xloc, yloc). These are candidates only; the caller still has to check the actual
+#distance.
+def grid_neighbors(config, grid, xloc, yloc):
+    analysis_dist = config.analysis_dist
+    neighbors = []
+    xlow = int(math.floor((xloc - analysis_dist) / analysis_dist))
+    xhigh = int(math.floor((xloc + analysis_dist) / analysis_dist))
+    ylow = int(math.floor((yloc - analysis_dist) / analysis_dist))
+    yhigh = int(math.floor((yloc + analysis_dist) / analysis_dist))
+    for xkey in range(xlow, xhigh + 1):
+        for ykey in range(ylow, yhigh + 1):
+            bucket = grid.get((xkey, ykey))
+            if bucket:
+                neighbors.extend(bucket)
+    return neighbors
+
+#Generate clustering values
+#For each cell1 seed cell (see edge.seed_weights), every cell2 cell within analysis_dist is
+#counted at its distance bin (see binning.py); the cumulative counts are the clustering values. With the
+#"isotropic" edge correction the pairs of seeds near the ROI edges are counted with their
+#edge weights instead of 1.
+#sp_data is a cellstore.CellStore, so only the cells of the two types are visited. The
+#compare loop only visits cell2 cells from the grid buckets around each seed (see
+#grid_index), so it scales with the number of neighbors rather than N^2.
+def cluster(config, sp_data, cell1, cell2):
+    start = clock()
+    report(config, "cluster in: " + str(start))
+    analysis_dist, edges = config.analysis_dist, bin_edges(config)
+    pair_hist = []
+    for unused in range(0, len(edges)):
+        pair_hist.append(0)
+    seed_group, target_group = sp_data.group(cell1), sp_data.group(cell2)
+    grid = grid_index(config, target_group)
+    #plain lists are indexed faster than the array columns in the compare loop
+    target_x, target_y = target_group.xloc.tolist(), target_group.yloc.tolist()
+    seed_x, seed_y, seed_ok = seed_group.xloc.tolist(), seed_group.yloc.tolist(), seed_group.seed
+    seeds = excluded = examined = 0
+    for position in range(0, len(seed_group)):
+        if seed_ok[position]:
+            seeds += 1
+            weights = seed_group.weights[position]
+            #setting these variables here shaves ~7-8% off runtime
+            xloc = seed_x[position]
+            yloc = seed_y[position]
+            neighbors = grid_neighbors(config, grid, xloc, yloc)
+            examined += len(neighbors)
+            for target in neighbors:
+                dist = math.sqrt((xloc - target_x[target])**2 + (yloc - target_y[target])**2)
+                if dist > 0 and dist <= analysis_dist:
+                    array_target = bisect_left(edges, dist)
+                    pair_hist[array_target] += weights[array_target]
+        else:
+            excluded += 1
+    data_cluster = cumulative_counts(pair_hist)
+    emit(config, "cluster", start, cells=len(sp_data), seeds=seeds, seeds_excluded=excluded,
+         pairs_examined=examined, pairs_in_range=sum(pair_hist))
+    report(config, "cluster out: " + str(clock()))
+    return data_cluster
+
+#Turn a histogram of pair counts per distance bin into the cumulative clustering curve,
+#where each position holds the number of pairs at that distance or closer.
+#One running sum replaces incrementing every farther position for every pair.
+def cumulative_counts(pair_hist):
+    data_cluster = []
+    running_total = 0.
+    for count in pair_hist:
+        running_total += count
+        data_cluster.append(running_total)
+    return data_cluster
+
+#Clustering values for two different cell types, both "perspectives" in one pass.
+#cluster(sp_data, cell1, cell2) and cluster(sp_data, cell2, cell1) measure the same cell1-cell2
+#distances and only differ in which end has to pass the exclusion test. Here every distance is
+#calculated once and counted for each direction whose seed cell passes it. The result is the
+#same as cluster_average() of the two separate runs.
+def cluster_pair(config, sp_data, cell1, cell2):
+    start = clock()
+    report(config, "cluster in: " + str(start))
+    analysis_dist, edges = config.analysis_dist, bin_edges(config)
+    pair_hist1 = []
+    pair_hist2 = []
+    for unused in range(0, len(edges)):
+        pair_hist1.append(0)
+        pair_hist2.append(0)
+    group1, group2 = sp_data.group(cell1), sp_data.group(cell2)
+    #cell2 cells are indexed separately depending on whether they can be seeds themselves
+    inside = []
+    near_edge = []
+    for position in range(0, len(group2)):
+        if group2.seed[position]:
+            inside.append(position)
+        else:
+            near_edge.append(position)
+    inside_grid = grid_index(config, group2, inside)
+    near_edge_grid = grid_index(config, group2, near_edge)
+    target_x, target_y, target_weights = group2.xloc.tolist(), group2.yloc.tolist(), group2.weights
+    seeds, excluded, examined = len(inside), len(near_edge), 0
+    for position in range(0, len(group1)):
+        seed_ok = group1.seed[position]
+        weights = group1.weights[position]
+        xloc = group1.xloc[position]
+        yloc = group1.yloc[position]
+        neighbors = grid_neighbors(config, inside_grid, xloc, yloc)
+        examined += len(neighbors)
+        for target in neighbors:
+            dist = math.sqrt((xloc - target_x[target])**2 + (yloc - target_y[target])**2)
+            if dist > 0 and dist <= analysis_dist:
+                array_target = bisect_left(edges, dist)
+                pair_hist2[array_target] += target_weights[target][array_target]
+                if seed_ok:
+                    pair_hist1[array_target] += weights[array_target]
+        if seed_ok:
+            seeds += 1
+            neighbors = grid_neighbors(config, near_edge_grid, xloc, yloc)
+            examined += len(neighbors)
+            for target in neighbors:
+                dist = math.sqrt((xloc - target_x[target])**2 + (yloc - target_y[target])**2)
+                if dist > 0 and dist <= analysis_dist:
+                    array_target = bisect_left(edges, dist)
+                    pair_hist1[array_target] += weights[array_target]
+        else:
+            excluded += 1
+    data_cluster = cluster_average(cumulative_counts(pair_hist1), cumulative_counts(pair_hist2))
+    emit(config, "cluster", start, cells=len(sp_data), seeds=seeds, seeds_excluded=excluded,
+         pairs_examined=examined, pairs_in_range=sum(pair_hist1) + sum(pair_hist2))
+    report(config, "cluster out: " + str(clock()))
+    return data_cluster
+
+#Pair counts per distance bin for every combination of the given cell types in one pass.
+#pair_hist[first][second] counts the pairs seen from seed cells of cell_types[first]
+#(see edge.seed_weights) to cells of cell_types[second]. Each pair is measured once and
+#counted from both ends, as in cluster_pair(): from each cell, only the cells of its own
+#type further on in the store and the cells of the types after it are measured.
+def cluster_matrix(config, sp_data, cell_types):
+    start = clock()
+    report(config, "cluster in: " + str(start))
+    analysis_dist, edges = config.analysis_dist, bin_edges(config)
+    pair_hist = []
+    for first in cell_types:
+        pair_row = []
+        for second in cell_types:
+            counts = []
+            for unused in range(0, len(edges)):
+                counts.append(0)
+            pair_row.append(counts)
+        pair_hist.append(pair_row)
+    groups = [sp_data.group(cell_type) for cell_type in cell_types]
+    grids = [grid_index(config, group) for group in groups]
+    columns = [(group.xloc.tolist(), group.yloc.tolist()) for group in groups]
+    cell_total, seeds, examined = 0, 0, 0
+    for first in range(0, len(cell_types)):
+        group = groups[first]
+        cell_total += len(group)
+        seeds += sum(group.seed)
+        first_x, first_y = columns[first]
+        for position in range(0, len(group)):
+            seed_ok = group.seed[position]
+            weights = group.weights[position]
+            xloc = first_x[position]
+            yloc = first_y[position]
+            for second in range(first, len(cell_types)):
+                target_x, target_y = columns[second]
+                target_seed, target_weights = groups[second].seed, groups[second].weights
+                forward, backward = pair_hist[first][second], pair_hist[second][first]
+                neighbors = grid_neighbors(config, grids[second], xloc, yloc)
+                examined += len(neighbors)
+                for target in neighbors:
+                    #within one type every pair is found from both ends, only measure it from
+                    #the earlier cell
+                    if (second > first or target > position) and (seed_ok or target_seed[target]):
+                        dist = math.sqrt((xloc - target_x[target])**2 + (yloc - target_y[target])**2)
+                        if dist > 0 and dist <= analysis_dist:
+                            array_target = bisect_left(edges, dist)
+                            if seed_ok:
+                                forward[array_target] += weights[array_target]
+                            if target_seed[target]:
+                                backward[array_target] += target_weights[target][array_target]
+    emit(config, "cluster", start, cells=len(sp_data), seeds=seeds, seeds_excluded=cell_total - seeds,
+         pairs_examined=examined, pairs_in_range=sum([sum(counts) for pair_row in pair_hist for counts in pair_row]))
+    report(config, "cluster out: " + str(clock()))
+    return pair_hist
+
+#Turn cluster_matrix() pair counts into the clustering values of each (cell1, cell2) pair
+def matrix_curves(pair_hist, cell_types, cell_pairs):
+    curves = []
+    for cell1, cell2 in cell_pairs:
+        first, second = cell_types.index(cell1), cell_types.index(cell2)
+        if first == second:
+            curves.append(cumulative_counts(pair_hist[first][first]))
+        else:
+            curves.append(cluster_average(cumulative_counts(pair_hist[first][second]),
+                                          cumulative_counts(pair_hist[second][first])))
+    return curves
+
+#Average together the results of the two runs (one from the "perspective" of each cell type)
+def cluster_average(cluster1, cluster2):
+    for interval in range(0, len(cluster1)):
+        cluster1[interval] = (float(cluster1[interval]) + float(cluster2[interval]))/2
+    return cluster1
+
+#Calculate clustering values for the cell1/cell2 comparison with the selected engine.
+#For two different cell types both "perspectives" are averaged (see cluster_pair).
+#sp_data is a cellstore.CellStore for the "python" engine and columns from
+#vectorized.cell_columns() for the "numpy" engine.
+def cluster_cells(config, sp_data, cell1, cell2):
+    if cell1 == cell2:
+        if config.engine == "numpy":
+            return vectorized.cluster_np(config, sp_data, cell1, cell1)
+        return cluster(config, sp_data, cell1, cell1)
+    if config.engine == "numpy":
+        return vectorized.cluster_pair_np(config, sp_data, cell1, cell2)
+    return cluster_pair(config, sp_data, cell1, cell2)
+
+#Clustering values for a list of (cell1, cell2) pairs, in the same order. A single pair goes
+#through cluster_cells(); several pairs share one distance search in cluster_matrix().
+def cluster_pairs(config, sp_data, cell_pairs):
+    if len(cell_pairs) == 1:
+        return [cluster_cells(config, sp_data, cell_pairs[0][0], cell_pairs[0][1])]
+    cell_types = []
+    for cell_pair in cell_pairs:
+        for cell_type in cell_pair:
+            if cell_type not in cell_types:
+                cell_types.append(cell_type)
+    if config.engine == "numpy":
+        pair_hist = vectorized.cluster_matrix_np(config, sp_data, cell_types)
+    else:
+        pair_hist = cluster_matrix(config, sp_data, cell_types)
+    return matrix_curves(pair_hist, cell_types, cell_pairs)
+
+#Label for one pair in printed and saved output
+def pair_label(cell_pair):
+    return "cells " + str(cell_pair[0]) + "-" + str(cell_pair[1])
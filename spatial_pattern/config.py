@@ -0,0 +1,113 @@
+##Settings for one spatial pattern analysis. These are the user set variables at the top of
+##SpatialPatternRefactor.py and SpatialPattern_NoLayers.py; see there for a fuller
+##description of each one.
+
+NULL_MODELS = ("layered", "uniform")
+ENGINES = ("python", "numpy")
+EDGE_CORRECTIONS = ("exclude", "isotropic")
+BIN_SPACINGS = ("linear", "log")
+DIMENSIONS = (2, 3)
+
+#All parameters of an analysis in one object, so that several configurations can be used in
+#the same process. Every function in this package that depends on a parameter takes the
+#config as its first argument.
+#
+#null_model picks how simulated cells are placed: "layered" keeps every cell in its own layer
+#(input files need a layer column, see SpatialPatternRefactor.py), "uniform" spreads the cells
+#over the whole ROI (see SpatialPattern_NoLayers.py). layer_num is only used by "layered".
+#edge_correction picks how seed cells near the ROI edges are handled (see edge.py);
+#exclude_dist is only used by "exclude".
+#With dimensions = 3 the z column of the input files is used as well: distances are 3D, seed
+#cells closer than exclude_dist_z to the top or bottom of the section are left out (None
+#keeps them all) and simulated cells are spread through the whole volume. This needs the
+#"uniform" null model, the "numpy" engine and the "exclude" edge correction, without tiles.
+#The distances from min_dist to analysis_dist are cut into interval_num bins, spaced as set by
+#bin_spacing (see binning.py).
+#With cache_directory set, input files are loaded through the binary cache in cellcache.py.
+#With tile_size set, input files are streamed and analyzed tile by tile (see tiled.py).
+#With sim_cache_directory set, simulation values are reused from disk (see simcache.py).
+#With envelope_quantiles set, simulation envelopes and p-values are added (see envelope.py).
+#With instruments set to a list of sinks, stage timings and counters are sent to them (see
+#instrument.py).
+#With verbose set, progress and results are printed as the analysis runs.
+class AnalysisConfig(object):
+    def __init__(self, cell1=1, cell2=3, cell_types=None, null_model="layered", layer_num=6,
+                 exclude_dist=100, analysis_dist=100, interval_num=100, sim_run_num=200,
+                 sim_tolerance=None, sim_min_runs=10, engine="python", sim_workers=1,
+                 sim_seed=None, cache_directory=None, tile_size=None, sim_cache_directory=None,
+                 sim_cache_size=100, envelope_quantiles=None, edge_correction="exclude",
+                 instruments=None, min_dist=0, bin_spacing="linear", dimensions=2, exclude_dist_z=None,
+                 verbose=True):
+        if null_model not in NULL_MODELS:
+            raise ValueError("null_model must be one of " + ", ".join(NULL_MODELS) + ", not " + repr(null_model))
+        if engine not in ENGINES:
+            raise ValueError("engine must be one of " + ", ".join(ENGINES) + ", not " + repr(engine))
+        if edge_correction not in EDGE_CORRECTIONS:
+            raise ValueError("edge_correction must be one of " + ", ".join(EDGE_CORRECTIONS) + ", not " + repr(edge_correction))
+        if bin_spacing not in BIN_SPACINGS:
+            raise ValueError("bin_spacing must be one of " + ", ".join(BIN_SPACINGS) + ", not " + repr(bin_spacing))
+        if not 0 <= min_dist < analysis_dist:
+            raise ValueError("min_dist must be at least 0 and smaller than analysis_dist, not " + repr(min_dist))
+        if bin_spacing == "log" and not min_dist > 0:
+            raise ValueError('bin_spacing = "log" needs min_dist larger than 0')
+        if int(interval_num) != interval_num or interval_num < 1:
+            raise ValueError("interval_num must be a whole number of at least 1, not " + repr(interval_num))
+        if dimensions not in DIMENSIONS:
+            raise ValueError("dimensions must be 2 or 3, not " + repr(dimensions))
+        if dimensions == 3 and (null_model != "uniform" or engine != "numpy" or edge_correction != "exclude" or
+                                tile_size is not None):
+            raise ValueError('dimensions = 3 needs null_model = "uniform", engine = "numpy", '
+                             'edge_correction = "exclude" and no tile_size')
+        if tile_size is not None and not tile_size > 0:
+            raise ValueError("tile_size must be larger than 0, not " + repr(tile_size))
+        if envelope_quantiles is not None and not 0 < envelope_quantiles[0] < envelope_quantiles[1] < 1:
+            raise ValueError("envelope_quantiles must be (low, high) with 0 < low < high < 1, not " + repr(envelope_quantiles))
+        self.cell1 = cell1
+        self.cell2 = cell2
+        self.cell_types = cell_types
+        self.null_model = null_model
+        self.layer_num = layer_num
+        self.exclude_dist = exclude_dist
+        self.analysis_dist = analysis_dist
+        self.interval_num = int(interval_num)
+        self.sim_run_num = sim_run_num
+        self.sim_tolerance = sim_tolerance
+        self.sim_min_runs = sim_min_runs
+        self.engine = engine
+        self.sim_workers = sim_workers
+        self.sim_seed = sim_seed
+        self.cache_directory = cache_directory
+        self.tile_size = tile_size
+        self.sim_cache_directory = sim_cache_directory
+        self.sim_cache_size = sim_cache_size
+        self.envelope_quantiles = envelope_quantiles
+        self.edge_correction = edge_correction
+        self.instruments = instruments
+        self.min_dist = min_dist
+        self.bin_spacing = bin_spacing
+        self.dimensions = dimensions
+        self.exclude_dist_z = exclude_dist_z
+        self.verbose = verbose
+
+    #A new config with some parameters changed, e.g. config.copy(sim_workers=1)
+    def copy(self, **changes):
+        settings = dict(self.__dict__)
+        settings.update(changes)
+        return AnalysisConfig(**settings)
+
+    #The (cell1, cell2) pairs to analyze: every pair of cell_types when that is set,
+    #otherwise just cell1 with cell2
+    def cell_pairs(self):
+        if not self.cell_types:
+            return [(self.cell1, self.cell2)]
+        cell_pairs = []
+        for first in range(0, len(self.cell_types)):
+            for second in range(first, len(self.cell_types)):
+                cell_pairs.append((self.cell_types[first], self.cell_types[second]))
+        return cell_pairs
+
+    def __repr__(self):
+        settings = []
+        for name in sorted(self.__dict__):
+            settings.append(name + "=" + repr(self.__dict__[name]))
+        return "AnalysisConfig(" + ", ".join(settings) + ")"
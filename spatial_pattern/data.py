@@ -0,0 +1,120 @@
+##Loading cell coordinate files and working out the ROI and layer boundaries
+
+from __future__ import division
+
+import csv
+
+from spatial_pattern.instrument import emit
+from spatial_pattern.progress import clock
+
+#Load and clean up a cell coordinate file, output is sp_data which is a list of all cells.
+#sp_data format is [[celltype1, xcoord1, ycoord1, layer1],[celltype2, xcoord2, ycoord2, layer2], etc]
+#The first line of the file (the header) is skipped. For the "layered" null model the layer is
+#read from column 4. For the "uniform" null model any further columns (z etc.) are ignored
+#and every cell is put in layer 0. With dimensions = 3 the z coordinate is read from column 4
+#and added at the end: [celltype, xcoord, ycoord, 0, zcoord].
+def loadfile(config, path):
+    start = clock()
+    sp_data = list(iter_cells(config, path))
+    emit(config, "loadfile", start, path=path, cells=len(sp_data), cached=False)
+    return sp_data
+
+#The cells of a coordinate file one at a time, in the loadfile() format, without holding the
+#whole file in memory
+def iter_cells(config, path):
+    input_file_obj = open(path, "r")
+    try:
+        csv_read = csv.reader(input_file_obj, dialect = csv.excel_tab)
+        next(csv_read, None)
+        for line in csv_read:
+            if config.null_model == "layered":
+                yield [int(line[0]), float(line[1]), float(line[2]), int(line[3])]
+            elif config.dimensions == 3:
+                yield [int(line[0]), float(line[1]), float(line[2]), 0, float(line[3])]
+            else:
+                yield [int(line[0]), float(line[1]), float(line[2]), 0]
+    finally:
+        input_file_obj.close()
+
+#The max and min x and y ROI boundaries of the cells, as (xmin, xmax, ymin, ymax)
+def roi_bounds(sp_data):
+    xmin, ymin, xmax, ymax = sp_data[0][1], sp_data[0][2], sp_data[0][1], sp_data[0][2]
+    for cell in sp_data:
+        if cell[1] < xmin:
+            xmin = cell[1]
+        if cell[1] > xmax:
+            xmax = cell[1]
+        if cell[2] < ymin:
+            ymin = cell[2]
+        if cell[2] > ymax:
+            ymax = cell[2]
+    return xmin, xmax, ymin, ymax
+
+#This function finds the max and min x and y ROI boundaries in the data file.
+#The data file is modified so that the distance of each cell from these boundaries is recorded
+#in positions cell[4] - cell[7]. The analysis itself only needs roi_bounds(); the seed test
+#works from the coordinates (see cellstore.py and vectorized.edge_mask).
+def boundaries(sp_data):
+    xmin, xmax, ymin, ymax = roi_bounds(sp_data)
+    for cell in sp_data:
+        xmin_dist = abs(cell[1] - xmin)
+        xmax_dist = abs(xmax - cell[1])
+        ymin_dist = abs(cell[2] - ymin)
+        ymax_dist = abs(ymax - cell[2])
+        cell.append(xmin_dist)
+        cell.append(xmax_dist)
+        cell.append(ymin_dist)
+        cell.append(ymax_dist)
+    return sp_data, xmin, xmax, ymin, ymax
+
+#The min and max z of cells with a z coordinate (see iter_cells), as (zmin, zmax). With
+#roi_bounds() this gives the box that is the ROI with dimensions = 3.
+def z_bounds(sp_data):
+    zmin, zmax = sp_data[0][4], sp_data[0][4]
+    for cell in sp_data:
+        if cell[4] < zmin:
+            zmin = cell[4]
+        if cell[4] > zmax:
+            zmax = cell[4]
+    return zmin, zmax
+
+#This sets boundaries by layer so that when random cell location simulations are generated,
+#they are performed by layer. This is necessary because cell density varies by layer.
+#ybound_list holds [top, bottom, layer] for each layer.
+def layer_ybound(config, sp_data_mod, ymin, ymax):
+    start = clock()
+    extremes = {}
+    for cell in sp_data_mod:
+        layer_extremes(extremes, cell)
+    ybound_list = layer_bands(config, extremes, ymax)
+    emit(config, "layer_ybound", start, cells=len(sp_data_mod), layers=len(ybound_list))
+    return ybound_list
+
+#Update the highest and lowest y location seen in the layer of one cell. extremes maps each
+#layer to [layer_max, layer_min].
+def layer_extremes(extremes, cell):
+    layer_range = extremes.get(cell[3])
+    if layer_range is None:
+        extremes[cell[3]] = [cell[2], cell[2]]
+    else:
+        if cell[2] > layer_range[0]:
+            layer_range[0] = cell[2]
+        if cell[2] < layer_range[1]:
+            layer_range[1] = cell[2]
+
+#Build ybound_list from the layer_extremes() of all cells
+def layer_bands(config, extremes, ymax):
+    layer_num = config.layer_num
+    ybound_list = []
+    for layer in range(0, layer_num):
+        layer_max, layer_min = extremes[layer + 1]
+        ybound_list.append([layer_max, layer_min, layer + 1])
+    #set layer boundaries by averaging the min from one layer with the max from the next layer
+    for layer in range(0, layer_num - 1):
+        layer_bound = (ybound_list[layer][1] + ybound_list[layer + 1][0]) / 2
+        ybound_list[layer][1], ybound_list[layer + 1][0] = layer_bound, layer_bound
+    #the first layer is stretched up to the ROI edge; as in the original scripts the bottom of
+    #the last layer stays at its lowest cell
+    if layer_num > 1:
+        ybound_list[0][0] = ymax
+    return ybound_list
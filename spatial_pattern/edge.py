@@ -0,0 +1,92 @@
+##Edge correction of the clustering values. With edge_correction = "exclude" (the original
+##method) only seed cells at least exclude_dist from the ROI boundaries are used. With
+##"isotropic" every cell in the ROI is a seed, and a pair at distance r is counted with
+##Ripley's isotropic weight: one over the share of the circle of radius r around the seed
+##that lies inside the ROI rectangle. Cells near the edges then make up for the partners
+##they cannot have outside the ROI instead of being dropped.
+##
+##The weights only depend on the seed and the distance bin. In the python engine each seed
+##gets a table of weights per bin that is filled in as its pairs are counted, so only the
+##bins it has pairs in are worked out (see SeedWeights). Seeds whose whole analysis circle
+##lies inside the ROI need no table at all.
+
+from __future__ import division
+
+import math
+
+from spatial_pattern.binning import bin_edges
+
+#Distance used for the weights of each bin: the middle of the distances that binning.py puts
+#in that bin (position 0 holds the pairs up to min_dist)
+def bin_radii(config):
+    edges = bin_edges(config)
+    radii = [edges[0] / 2]
+    for bin_num in range(1, len(edges)):
+        radii.append((edges[bin_num - 1] + edges[bin_num]) / 2)
+    return radii
+
+#Share of the circle of the given radius around a point that lies inside the ROI.
+#edge_dists are the distances of the point to xmin, xmax, ymin and ymax.
+#Each boundary closer than the radius cuts off an arc; the arcs of two neighboring
+#boundaries overlap when the corner between them lies inside the circle.
+def circle_inside(edge_dists, radius):
+    arcs = []
+    for edge_dist in edge_dists:
+        if edge_dist < radius:
+            arcs.append(math.acos(edge_dist / radius))
+        else:
+            arcs.append(0.)
+    outside = 2 * sum(arcs)
+    for side in (0, 1):
+        for end in (2, 3):
+            if edge_dists[side]**2 + edge_dists[end]**2 < radius**2:
+                outside -= arcs[side] + arcs[end] - math.pi / 2
+    return 1 - outside / (2 * math.pi)
+
+#Isotropic weight of the pairs at the given radius from a point. A circle that lies wholly
+#outside the ROI (a radius past its farthest corner) can hold no pairs and gets weight 0.
+def isotropic_weight(edge_dists, radius):
+    inside = circle_inside(edge_dists, radius)
+    if inside <= 0:
+        return 0.
+    return 1 / inside
+
+#Isotropic weights of the pairs seen from a seed with the given edge_dists, looked up by bin
+#number as in a list. A weight is only worked out the first time a pair falls in its bin and
+#then kept, so the bins the seed has no pairs in cost nothing.
+class SeedWeights(dict):
+    def __init__(self, edge_dists, radii):
+        dict.__init__(self)
+        self.edge_dists = edge_dists
+        self.radii = radii
+        self.nearest = min(edge_dists)
+
+    def __missing__(self, bin_num):
+        radius = self.radii[bin_num]
+        if radius <= self.nearest:
+            weight = 1.
+        else:
+            weight = isotropic_weight(self.edge_dists, radius)
+        self[bin_num] = weight
+        return weight
+
+#Isotropic weights of the pairs seen from a seed with the given edge_dists (a SeedWeights),
+#or None when every weight would be 1 because the analysis circle lies inside the ROI
+def isotropic_weights(config, edge_dists, radii):
+    if min(edge_dists) >= config.analysis_dist:
+        return None
+    return SeedWeights(edge_dists, radii)
+
+#Whether a cell is used as a seed, and the weights of its pairs, one per bin. unit_weights
+#is the list of 1s used when no correction is needed, so that the counting loops can always
+#look the weight up. edge_dists are the distances of the cell to xmin, xmax, ymin and ymax
+#(see cellstore.CellStore.add); radii come from bin_radii().
+def seed_weights(config, edge_dists, radii, unit_weights):
+    if config.edge_correction == "isotropic":
+        weights = isotropic_weights(config, edge_dists, radii)
+        if weights is None:
+            return True, unit_weights
+        return True, weights
+    exclude_dist = config.exclude_dist
+    return (edge_dists[0] > exclude_dist and edge_dists[1] > exclude_dist and edge_dists[2] > exclude_dist and
+            edge_dists[3] > exclude_dist), unit_weights
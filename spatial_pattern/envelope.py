@@ -0,0 +1,187 @@
+##Simulation envelopes and significance tests, worked out while the simulations stream past.
+##Every simulation run is looked at once and then dropped, so memory use does not grow with
+##the number of runs: the global test keeps a bounded random sample (reservoir) of simulated
+##curves, and the quantile bands are taken exactly from the reservoir while it still holds
+##every run, and from the P-square estimator (Jain and Chlamtac, 1985), which keeps five
+##markers per distance, once there are more runs than it holds.
+
+from __future__ import division
+
+import math
+import random
+
+from spatial_pattern.simulate import sim_correct, sim_stats_update
+
+#Largest number of simulated curves kept per cell pair for the global test
+RESERVOIR_SIZE = 500
+
+#Running estimate of one quantile of a stream of values with the P-square method. Only five
+#marker heights and positions are stored, however many values are added.
+class P2Quantile(object):
+    def __init__(self, quantile):
+        self.quantile = quantile
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value):
+        heights, positions = self.heights, self.positions
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+        #find the cell the value falls in, stretching the outer markers if needed
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+        for marker in range(cell + 1, 5):
+            positions[marker] += 1
+        for marker in range(0, 5):
+            self.desired[marker] += self.increments[marker]
+        #move the middle markers towards their desired positions
+        for marker in range(1, 4):
+            offset = self.desired[marker] - positions[marker]
+            if ((offset >= 1 and positions[marker + 1] - positions[marker] > 1) or
+                    (offset <= -1 and positions[marker - 1] - positions[marker] < -1)):
+                step = 1 if offset > 0 else -1
+                height = self.parabolic(marker, step)
+                if not heights[marker - 1] < height < heights[marker + 1]:
+                    height = heights[marker] + step * (heights[marker + step] - heights[marker]) / (positions[marker + step] - positions[marker])
+                heights[marker] = height
+                positions[marker] += step
+
+    #Piecewise-parabolic prediction of a marker height moved by step
+    def parabolic(self, marker, step):
+        heights, positions = self.heights, self.positions
+        return heights[marker] + step / (positions[marker + 1] - positions[marker - 1]) * (
+            (positions[marker] - positions[marker - 1] + step) * (heights[marker + 1] - heights[marker]) / (positions[marker + 1] - positions[marker]) +
+            (positions[marker + 1] - positions[marker] - step) * (heights[marker] - heights[marker - 1]) / (positions[marker] - positions[marker - 1]))
+
+    #Current estimate. Up to five values are all kept, so the quantile is interpolated exactly.
+    def value(self):
+        heights = self.heights
+        if len(heights) < 5 or len(heights) == 5 and self.positions[4] == 5:
+            return exact_quantile(heights, self.quantile)
+        return heights[2]
+
+#Quantile of a list of values, interpolated linearly between the two nearest sorted values
+def exact_quantile(values, quantile):
+    if len(values) == 0:
+        return 0.
+    values = sorted(values)
+    location = quantile * (len(values) - 1)
+    lower = int(location)
+    if lower + 1 >= len(values):
+        return values[lower]
+    return values[lower] + (location - lower) * (values[lower + 1] - values[lower])
+
+#Envelope and tests of one cell pair, filled in by sim_iterate() one simulation at a time.
+#data_cluster is the clustering curve of the real cells; it is needed up front for the
+#pointwise p-values. After finish(), the attributes below hold the results; the ratio_*
+#curves are in the same units as the output clustering value (data / averaged simulation):
+#  sim_low, sim_high      quantile band of the simulated values (config.envelope_quantiles)
+#  sim_min, sim_max       lowest and highest simulated value at each distance
+#  ratio_low, ratio_high, ratio_min, ratio_max   the same divided by the averaged simulation
+#  p_clustered            pointwise p-value of at least this many pairs by chance
+#  p_dispersed            pointwise p-value of at most this many pairs by chance
+#  global_p               p-value of the largest deviation from the average over all distances,
+#                         each distance scaled by the spread of its simulated values
+#                         (studentized maximum deviation test against the reservoir of runs)
+class SimEnvelope(object):
+    def __init__(self, config, data_cluster):
+        low_quantile, high_quantile = config.envelope_quantiles
+        self.data_cluster = data_cluster
+        self.low_quantiles = []
+        self.high_quantiles = []
+        for location in range(0, len(data_cluster)):
+            self.low_quantiles.append(P2Quantile(low_quantile))
+            self.high_quantiles.append(P2Quantile(high_quantile))
+        self.sim_min = None
+        self.sim_max = None
+        self.above = [0] * len(data_cluster)
+        self.below = [0] * len(data_cluster)
+        self.sim_mean = [0.] * len(data_cluster)
+        self.sim_m2 = [0.] * len(data_cluster)
+        self.reservoir = []
+        self.rng = None
+        self.run_total = 0
+
+    #Seed the reservoir sampling; sim_iterate() calls this with the simulation seed, so the
+    #global test is repeatable too
+    def start(self, seed):
+        self.rng = random.Random(seed)
+
+    #Add one simulated curve
+    def add(self, sim_cluster):
+        self.run_total += 1
+        if self.sim_min is None:
+            self.sim_min = list(sim_cluster)
+            self.sim_max = list(sim_cluster)
+        for location in range(0, len(sim_cluster)):
+            value = sim_cluster[location]
+            self.low_quantiles[location].add(value)
+            self.high_quantiles[location].add(value)
+            if value < self.sim_min[location]:
+                self.sim_min[location] = value
+            if value > self.sim_max[location]:
+                self.sim_max[location] = value
+            if value >= self.data_cluster[location]:
+                self.above[location] += 1
+            if value <= self.data_cluster[location]:
+                self.below[location] += 1
+        sim_stats_update(self.sim_mean, self.sim_m2, self.run_total, sim_cluster)
+        #reservoir sampling: every run has the same chance of being kept
+        if len(self.reservoir) < RESERVOIR_SIZE:
+            self.reservoir.append(list(sim_cluster))
+        else:
+            slot = self.rng.randrange(self.run_total)
+            if slot < RESERVOIR_SIZE:
+                self.reservoir[slot] = list(sim_cluster)
+
+    #Work out the results once all runs are in; sim_cluster is the averaged simulation.
+    #The P-square estimates are far off for the few tens of runs often used, so as long as the
+    #reservoir still holds every run the quantiles are taken from it exactly instead.
+    def finish(self, sim_cluster):
+        if self.run_total <= RESERVOIR_SIZE:
+            low_quantile, high_quantile = self.low_quantiles[0].quantile, self.high_quantiles[0].quantile
+            self.sim_low = []
+            self.sim_high = []
+            for location in range(0, len(self.data_cluster)):
+                values = [reservoir_cluster[location] for reservoir_cluster in self.reservoir]
+                self.sim_low.append(exact_quantile(values, low_quantile))
+                self.sim_high.append(exact_quantile(values, high_quantile))
+        else:
+            self.sim_low = [quantile.value() for quantile in self.low_quantiles]
+            self.sim_high = [quantile.value() for quantile in self.high_quantiles]
+        self.ratio_low = sim_correct(self.sim_low, sim_cluster)
+        self.ratio_high = sim_correct(self.sim_high, sim_cluster)
+        self.ratio_min = sim_correct(self.sim_min, sim_cluster)
+        self.ratio_max = sim_correct(self.sim_max, sim_cluster)
+        self.p_clustered = [(count + 1) / (self.run_total + 1) for count in self.above]
+        self.p_dispersed = [(count + 1) / (self.run_total + 1) for count in self.below]
+        sim_spread = []
+        for location in range(0, len(self.sim_m2)):
+            sim_spread.append(math.sqrt(self.sim_m2[location] / max(self.run_total - 1, 1)))
+        data_deviation = max_deviation(self.data_cluster, sim_cluster, sim_spread)
+        exceed = 0
+        for reservoir_cluster in self.reservoir:
+            if max_deviation(reservoir_cluster, sim_cluster, sim_spread) >= data_deviation:
+                exceed += 1
+        self.global_p = (exceed + 1) / (len(self.reservoir) + 1)
+
+#Largest deviation of a curve from the averaged simulation in standard deviations of the
+#simulated values, over the distances where the simulated values vary at all
+def max_deviation(cluster, sim_cluster, sim_spread):
+    deviation = 0.
+    for location in range(0, len(cluster)):
+        if sim_spread[location] > 0:
+            deviation = max(deviation, abs(cluster[location] - sim_cluster[location]) / sim_spread[location])
+    return deviation
@@ -0,0 +1,133 @@
+##Saving analysis results
+
+import csv
+import sys
+
+from spatial_pattern.binning import edge_labels
+from spatial_pattern.cluster import pair_label
+
+#Largest number of columns in an .xls sheet
+XLS_COLUMNS = 256
+
+#Rows of envelope results for one pair, as (label, values per distance)
+def envelope_rows(envelope, sp_output):
+    return [("output clustering value", sp_output),
+            ("envelope low", envelope.ratio_low),
+            ("envelope high", envelope.ratio_high),
+            ("simulation min", envelope.ratio_min),
+            ("simulation max", envelope.ratio_max),
+            ("p clustered", envelope.p_clustered),
+            ("p dispersed", envelope.p_dispersed)]
+
+#Rows of K(r), L(r) and g(r) for one pair, as (label, values per distance)
+def curve_rows(result, pair_num):
+    return [("K", result.k_curves[pair_num]),
+            ("L", result.l_curves[pair_num]),
+            ("g", result.g_curves[pair_num])]
+
+#Raise a ValueError when results cannot be saved in output_format (an extension without the
+#dot, e.g. "xls"): an unknown format, or more distances than an .xls sheet has columns. Called
+#before an analysis is run, so that no results are lost when saving them would fail.
+def check_output_format(config, output_format):
+    if output_format.lower() != "xls":
+        from spatial_pattern.tables import table_format
+        table_format("results." + output_format)
+        return
+    distance_total = len(edge_labels(config))
+    if distance_total + 1 > XLS_COLUMNS:
+        raise ValueError(str(distance_total) + " distances do not fit in the " + str(XLS_COLUMNS) +
+                         " columns of an .xls sheet; save as .csv, .npz, .parquet or .xlsx instead")
+
+#Save the corrected clustering values to an Excel spreadsheet, one sheet per pair of cell
+#types. Needs the xlwt library. With envelopes, each pair gets a second sheet holding the
+#envelope and p-values next to the clustering values, with a label in front of each row.
+#K(r), L(r) and g(r) of each pair go on a sheet of their own, laid out the same way.
+#.xls sheets hold at most 256 columns; a savepath ending in .csv, .npz, .parquet or .xlsx
+#saves a columnar table instead (see tables.py), which has no such limit.
+def save_output(config, savepath, result):
+    if not savepath.lower().endswith(".xls"):
+        from spatial_pattern.tables import save_table
+        save_table(config, savepath, result)
+        return
+    check_output_format(config, "xls")
+    labels = edge_labels(config)
+    import xlwt
+    #set up worksheet to write to
+    book = xlwt.Workbook(encoding="utf-8")
+    for pair_num in range(0, len(result.cell_pairs)):
+        if len(result.cell_pairs) == 1:
+            sheet1 = book.add_sheet("Python Sheet 1")
+        else:
+            sheet1 = book.add_sheet(pair_label(result.cell_pairs[pair_num]))
+
+        ##populate excel worksheet
+        for location in range(0, len(labels)):
+            sheet1.write(0, location, labels[location])
+            sheet1.write(1, location, result.sp_outputs[pair_num][location])
+
+        if result.envelopes:
+            envelope = result.envelopes[pair_num]
+            if len(result.cell_pairs) == 1:
+                sheet2 = book.add_sheet("Envelope")
+            else:
+                sheet2 = book.add_sheet(pair_label(result.cell_pairs[pair_num]) + " envelope")
+            rows = envelope_rows(envelope, result.sp_outputs[pair_num])
+            write_rows(sheet2, labels, rows)
+            sheet2.write(len(rows) + 2, 0, "global test p-value")
+            sheet2.write(len(rows) + 2, 1, envelope.global_p)
+
+        if result.k_curves:
+            if len(result.cell_pairs) == 1:
+                sheet3 = book.add_sheet("Curves")
+            else:
+                sheet3 = book.add_sheet(pair_label(result.cell_pairs[pair_num]) + " curves")
+            write_rows(sheet3, labels, curve_rows(result, pair_num))
+
+    #save the spreadsheet
+    book.save(savepath)
+
+#Write labeled rows of values per distance to a sheet, under a row of distance labels
+def write_rows(sheet, labels, rows):
+    for location in range(0, len(labels)):
+        sheet.write(0, location + 1, labels[location])
+    for row_num in range(0, len(rows)):
+        sheet.write(row_num + 1, 0, rows[row_num][0])
+        for location in range(0, len(labels)):
+            sheet.write(row_num + 1, location + 1, rows[row_num][1][location])
+
+#Open a file for the csv module in the way the running Python version expects
+def open_csv(path, mode):
+    if sys.version_info[0] < 3:
+        return open(path, mode + "b")
+    return open(path, mode, newline="")
+
+#The rows of the results of one analysis, as (label, values per distance): the corrected
+#clustering values of each cell pair, labeled e.g. "1-3", followed by its K(r), L(r) and g(r)
+#rows, labeled e.g. "1-3 K". With envelopes these are followed by the envelope rows, labeled
+#e.g. "1-3 envelope low", and a "1-3 global test p-value" row holding the one value.
+def result_rows(result):
+    rows = []
+    for pair_num in range(0, len(result.cell_pairs)):
+        cell_pair = result.cell_pairs[pair_num]
+        pair_name = str(cell_pair[0]) + "-" + str(cell_pair[1])
+        rows.append((pair_name, result.sp_outputs[pair_num]))
+        if result.k_curves:
+            for label, values in curve_rows(result, pair_num):
+                rows.append((pair_name + " " + label, values))
+        if result.envelopes:
+            envelope = result.envelopes[pair_num]
+            for label, values in envelope_rows(envelope, result.sp_outputs[pair_num])[1:]:
+                rows.append((pair_name + " " + label, values))
+            rows.append((pair_name + " global test p-value", [envelope.global_p]))
+    return rows
+
+#Write the rows of result_rows() as a tab-delimited table, one row per cell pair and measure
+def write_results(config, path, result):
+    output_obj = open_csv(path, "w")
+    try:
+        csv_write = csv.writer(output_obj, dialect = csv.excel_tab)
+        csv_write.writerow(["cells"] + edge_labels(config))
+        for label, values in result_rows(result):
+            csv_write.writerow([label] + list(values))
+    finally:
+        output_obj.close()
@@ -0,0 +1,13 @@
+##Progress messages printed while an analysis runs
+
+from __future__ import print_function
+
+import time
+
+#Timer for the "cluster in/out" messages; time.clock() in older Pythons
+clock = getattr(time, "perf_counter", None) or time.clock
+
+#Print a progress message when the config asks for it
+def report(config, message):
+    if config.verbose:
+        print(message)
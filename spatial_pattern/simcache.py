@@ -0,0 +1,128 @@
+##On-disk cache of averaged simulation values. The simulations only depend on the cell types
+##and layers of the cells (not on where the real cells are), the ROI and layer boundaries, the
+##parameters and the seed, so re-analyzing a sample, or another sample with the same cells,
+##can reuse them. The cache is limited in size; the entries used longest ago are removed first.
+
+import hashlib
+import json
+import os
+
+from spatial_pattern.progress import report
+from spatial_pattern.simulate import sim_iterate, sim_run
+
+#Changing this makes every older cache entry unreachable, e.g. when the simulations change
+CACHE_VERSION = "null curves 3"
+
+#Hash of everything the simulation values depend on. The cell types and layers are hashed
+#in file order, because the random numbers are drawn in that order; cell_layers is any iterable
+#of (cell type, layer) pairs, so the tiled mode can stream it. zbounds is [zmin, zmax] in 3D.
+def null_key(config, cell_layers, cell_pairs, xmin, xmax, ymin, ymax, ybound_list, zbounds=None):
+    digest = hashlib.sha1()
+    settings = (CACHE_VERSION, config.null_model, config.layer_num, config.exclude_dist,
+                config.analysis_dist, config.interval_num, config.sim_run_num, config.sim_tolerance,
+                config.sim_min_runs, config.engine, config.tile_size is not None, config.edge_correction,
+                config.min_dist, config.bin_spacing, config.dimensions, config.exclude_dist_z,
+                [list(cell_pair) for cell_pair in cell_pairs], [xmin, xmax, ymin, ymax], ybound_list, zbounds)
+    digest.update(repr(settings).encode("ascii"))
+    for cell_type, layer in cell_layers:
+        digest.update(("%d\t%d\n" % (cell_type, layer)).encode("ascii"))
+    return digest.hexdigest()
+
+def entry_path(config, key, seed):
+    return os.path.join(config.sim_cache_directory, key + "." + str(seed) + ".json")
+
+#Cache files for a key, most recently used first
+def key_entries(config, key):
+    entries = []
+    for file_name in os.listdir(config.sim_cache_directory):
+        if file_name.startswith(key + ".") and file_name.endswith(".json"):
+            entry = os.path.join(config.sim_cache_directory, file_name)
+            try:
+                entries.append((os.path.getmtime(entry), entry))
+            except OSError:
+                continue
+    entries.sort(reverse=True)
+    return [entry for used_time, entry in entries]
+
+#Look up the simulation values for a key. With sim_seed set only an entry made with that
+#seed will do; otherwise any seed is fine and the most recently used entry is taken.
+#Returns (sim_clusters, run_total, seed) or None.
+def load_null(config, key):
+    if config.sim_seed is not None:
+        entries = [entry_path(config, key, config.sim_seed)]
+    else:
+        entries = key_entries(config, key)
+    for entry in entries:
+        try:
+            entry_file_obj = open(entry, "r")
+            try:
+                saved = json.load(entry_file_obj)
+            finally:
+                entry_file_obj.close()
+            #mark as used for the eviction order
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError):
+            #missing, removed by another process or half written; try the next one
+            continue
+        return saved["sim_clusters"], saved["sim_runs"], saved["sim_seed"]
+    return None
+
+#Store simulation values under a key, then shrink the cache back to its size limit.
+#The entry is written under a temporary name and renamed, as in cellcache.py.
+def save_null(config, key, sim_clusters, run_total, seed):
+    entry = entry_path(config, key, seed)
+    temp_file = entry + "." + str(os.getpid()) + ".tmp"
+    temp_obj = open(temp_file, "w")
+    try:
+        json.dump({"sim_clusters": sim_clusters, "sim_runs": run_total, "sim_seed": seed}, temp_obj)
+    finally:
+        temp_obj.close()
+    if os.path.exists(entry):
+        os.remove(entry)
+    os.rename(temp_file, entry)
+    evict(config, entry)
+
+#Remove the least recently used entries until the cache fits in sim_cache_size megabytes.
+#The entry just saved (keep) always stays, even if it is larger than the limit on its own.
+def evict(config, keep=None):
+    entries = []
+    cache_total = 0
+    for file_name in os.listdir(config.sim_cache_directory):
+        if file_name.endswith(".json"):
+            entry = os.path.join(config.sim_cache_directory, file_name)
+            try:
+                entries.append((os.path.getmtime(entry), os.path.getsize(entry), entry))
+            except OSError:
+                continue
+            cache_total += entries[-1][1]
+    entries.sort()
+    for used_time, entry_size, entry in entries:
+        if cache_total <= config.sim_cache_size * 1024 * 1024:
+            break
+        if entry == keep:
+            continue
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+        cache_total -= entry_size
+
+#sim_iterate() through the cache: with sim_cache_directory set and a key from null_key(), the
+#simulations are only run when the cache has no entry for them. Same arguments and return
+#values as sim_iterate(). Envelopes need every run and their p-values depend on the data
+#values, so the cache is not used when envelopes are given.
+def sim_iterate_cached(config, key, sp_data_mod, cell_pairs, xmin, xmax, ymin, ymax, ybound_list, sim_function=sim_run,
+                       envelopes=None):
+    if config.sim_cache_directory is None or key is None or envelopes:
+        return sim_iterate(config, sp_data_mod, cell_pairs, xmin, xmax, ymin, ymax, ybound_list, sim_function,
+                           envelopes)
+    if not os.path.isdir(config.sim_cache_directory):
+        os.makedirs(config.sim_cache_directory)
+    cached = load_null(config, key)
+    if cached is not None:
+        report(config, "simulation seed: " + str(cached[2]))
+        report(config, "simulation values loaded from the cache (" + str(cached[1]) + " runs)")
+        return cached
+    sim_clusters, run_total, seed = sim_iterate(config, sp_data_mod, cell_pairs, xmin, xmax, ymin, ymax, ybound_list, sim_function)
+    save_null(config, key, sim_clusters, run_total, seed)
+    return sim_clusters, run_total, seed
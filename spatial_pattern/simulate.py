@@ -0,0 +1,175 @@
+##Simulations of random cell placement, used to density-correct the clustering values
+
+from __future__ import division
+
+import math
+import multiprocessing
+import random
+
+from spatial_pattern import vectorized
+from spatial_pattern.cellstore import CellStore
+from spatial_pattern.cluster import cluster_pairs
+from spatial_pattern.instrument import emit
+from spatial_pattern.progress import clock, report
+
+#Make a simulated version of the cell distribution with random locations, as a new
+#cellstore.CellStore with the same cell types and layers in the same order as sp_data
+#For the "layered" null model each cell stays inside the ybound_list band of its own layer.
+def sim_gen(config, sp_data, xmin, xmax, ymin, ymax, ybound_list, rng):
+    sim_data = CellStore(config, xmin, xmax, ymin, ymax)
+    for cell_num in range(0, len(sp_data)):
+        layer = sp_data.layer[cell_num]
+        yrand = rng.uniform(ybound_list[layer-1][0], ybound_list[layer-1][1])
+        sim_data.add(sp_data.cell_type[cell_num], rng.uniform(xmin, xmax), yrand, layer)
+    return sim_data
+
+#Make a simulated version of the cell distribution for the "uniform" null model, with every
+#cell placed anywhere in the ROI
+def sim_gen_uniform(config, sp_data, xmin, xmax, ymin, ymax, rng):
+    sim_data = CellStore(config, xmin, xmax, ymin, ymax)
+    for cell_num in range(0, len(sp_data)):
+        sim_data.add(sp_data.cell_type[cell_num], rng.uniform(xmin, xmax), rng.uniform(ymin, ymax),
+                     sp_data.layer[cell_num])
+    return sim_data
+
+#Each simulation run draws from its own random number generator, seeded from the run seed
+#and the run number. A run therefore gives the same result in any worker process.
+def sim_random(config, seed, run_count):
+    if config.engine == "numpy":
+        return vectorized.numpy.random.RandomState([seed, run_count])
+    return random.Random(seed * 1000003 + run_count)
+
+#Generate one simulated cell distribution and calculate the clustering values of each pair
+#ybound_list is only used by the "layered" null model. For the "numpy" engine it holds the
+#vectorized.layer_geometry() arrays instead of the list itself.
+def sim_run(run_count, seed, config, sp_data_mod, cell_pairs, xmin, xmax, ymin, ymax, ybound_list):
+    rng = sim_random(config, seed, run_count)
+    start = clock()
+    if config.engine == "numpy":
+        if config.null_model == "layered":
+            sim_raw = vectorized.sim_gen_np(config, sp_data_mod, xmin, xmax, ymin, ymax, ybound_list, rng)
+        else:
+            sim_raw = vectorized.sim_gen_uniform_np(config, sp_data_mod, xmin, xmax, ymin, ymax, rng)
+        cell_total = len(sim_raw[1])
+    else:
+        if config.null_model == "layered":
+            sim_raw = sim_gen(config, sp_data_mod, xmin, xmax, ymin, ymax, ybound_list, rng)
+        else:
+            sim_raw = sim_gen_uniform(config, sp_data_mod, xmin, xmax, ymin, ymax, rng)
+        cell_total = len(sim_raw)
+    emit(config, "sim_gen", start, run=run_count, cells=cell_total)
+    return cluster_pairs(config, sim_raw, cell_pairs)
+
+#Worker process side of the simulation pool. The data are handed over once per worker
+#by sim_worker_init instead of once per simulation run.
+def sim_worker_init(sim_function, *sim_args):
+    global sim_worker_function, sim_worker_args
+    sim_worker_function = sim_function
+    sim_worker_args = sim_args
+
+def sim_worker_run(run_count):
+    return sim_worker_function(run_count, *sim_worker_args)
+
+#Update the running mean and sum of squared deviations of the simulated values at each
+#distance with one more simulation run (Welford's online method).
+def sim_stats_update(sim_mean, sim_m2, run_total, sim_cluster):
+    for location in range(0, len(sim_cluster)):
+        delta = sim_cluster[location] - sim_mean[location]
+        sim_mean[location] += delta / run_total
+        sim_m2[location] += delta * (sim_cluster[location] - sim_mean[location])
+
+#Check whether the averaged simulation values are precise enough to stop early: the
+#standard error of the mean has to be within sim_tolerance of the mean at every distance.
+#Distances where no simulation found any pairs have nothing left to estimate.
+def sim_converged(config, sim_mean, sim_m2, run_total):
+    if config.sim_tolerance is None or run_total < max(config.sim_min_runs, 2):
+        return False
+    for location in range(0, len(sim_mean)):
+        if sim_mean[location] > 0:
+            std_err = math.sqrt(sim_m2[location] / (run_total - 1) / run_total)
+            if std_err > config.sim_tolerance * sim_mean[location]:
+                return False
+    return True
+
+#This is the main function that runs simulations of cellular location
+#With sim_workers other than 1 the runs are spread over a pool of processes. Results are
+#collected in run order, so the sums are the same as when running them one after another.
+#With sim_tolerance set, the runs stop once sim_converged() is satisfied. The check is done
+#in run order too, so the number of runs used does not depend on sim_workers either.
+#Returns the averaged simulation values for each of cell_pairs, in the same order, the
+#number of runs used and the seed.
+#sim_function runs one simulation; it is called like sim_run() with sp_data_mod passed on
+#as it is (the tiled mode passes the input file path instead, see tiled.py).
+#envelopes, if given, holds an envelope.SimEnvelope per pair that is shown every run.
+#With config.instruments set, every run sends a "sim_run" event with its latency (the time
+#since the previous result came in) and an eta for the remaining runs, assuming all
+#sim_run_num are needed.
+def sim_iterate(config, sp_data_mod, cell_pairs, xmin, xmax, ymin, ymax, ybound_list, sim_function=sim_run,
+                envelopes=None):
+    start = clock()
+    bin_total = config.interval_num + 1
+    sim_track = []
+    sim_mean = []
+    sim_m2 = []
+    for cell_pair in cell_pairs:
+        sim_track.append([0] * bin_total)
+        sim_mean.append([0.] * bin_total)
+        sim_m2.append([0.] * bin_total)
+    seed = config.sim_seed
+    if seed is None:
+        seed = random.randint(0, 2**31 - 1)
+    report(config, "simulation seed: " + str(seed))
+    if envelopes:
+        for envelope in envelopes:
+            envelope.start(seed)
+    sim_args = (seed, config, sp_data_mod, cell_pairs, xmin, xmax, ymin, ymax, ybound_list)
+    pool = None
+    if config.sim_workers == 1:
+        sim_results = (sim_function(run_count, *sim_args) for run_count in range(0, config.sim_run_num))
+    else:
+        pool = multiprocessing.Pool(config.sim_workers or None, sim_worker_init, (sim_function,) + sim_args)
+        sim_results = pool.imap(sim_worker_run, range(0, config.sim_run_num))
+    run_total = 0
+    loop_start = run_start = clock()
+    try:
+        for sim_clusters in sim_results:
+            run_total += 1
+            report(config, "simulation run " + str(run_total))
+            if config.instruments:
+                elapsed = clock() - loop_start
+                emit(config, "sim_run", run_start, run=run_total,
+                     eta=elapsed / run_total * (config.sim_run_num - run_total))
+                run_start = loop_start + elapsed
+            converged = True
+            for pair_num in range(0, len(cell_pairs)):
+                for location in range(0, bin_total):
+                    sim_track[pair_num][location] = sim_track[pair_num][location] + sim_clusters[pair_num][location]
+                sim_stats_update(sim_mean[pair_num], sim_m2[pair_num], run_total, sim_clusters[pair_num])
+                if envelopes:
+                    envelopes[pair_num].add(sim_clusters[pair_num])
+                if not sim_converged(config, sim_mean[pair_num], sim_m2[pair_num], run_total):
+                    converged = False
+            if converged:
+                report(config, "simulations converged after " + str(run_total) + " runs")
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+    for pair_track in sim_track:
+        for location in range(0, bin_total):
+            pair_track[location] = pair_track[location] / run_total
+    emit(config, "sim_iterate", start, runs=run_total, seed=seed, workers=config.sim_workers, pairs=len(cell_pairs))
+    return sim_track, run_total, seed
+
+#Use simulation output to correct density-correct clustering data
+#Distances where the simulations found no pairs are left at 0.
+def sim_correct(data_cluster, sim_cluster):
+    corrected_output = []
+    for unused in range(0, len(data_cluster)):
+        corrected_output.append(0)
+    for location in range(0, len(data_cluster)):
+        try:
+            corrected_output[location] = data_cluster[location] / sim_cluster[location]
+        except ZeroDivisionError:
+            pass
+    return corrected_output
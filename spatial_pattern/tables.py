@@ -0,0 +1,164 @@
+##Columnar result tables: the rows of write_results() for any number of cases in one table,
+##with the columns
+##  case      name of the case (input file) the row comes from
+##  cells     what the row holds, e.g. "1-3" for the clustering values of cell types 1 and 3,
+##            "1-3 K" or "1-3 envelope low" (see write_results() in output.py)
+##  ...       one column per distance, labeled as in edge_labels(), e.g. "25 um"
+##The single value of a "global test p-value" row is in the first distance column; the other
+##columns of that row are left empty (NaN in .npz files).
+##
+##The format is picked by the file extension:
+##  .csv      comma separated text
+##  .npz      numpy arrays "case", "cells", "distances" (the column labels) and "values" (one
+##            row of floats per table row); needs the numpy library
+##  .parquet  needs the pyarrow library
+##  .xlsx     Excel 2007 and later; needs the openpyxl library
+##None of these has the 256 column limit of .xls sheets.
+##
+##Tables are written one case at a time with write_case() and finished with close(), and only
+##the case being written is held in memory, so a batch of any size gives one table.
+
+import csv
+import os
+import tempfile
+
+from spatial_pattern.binning import edge_labels
+from spatial_pattern.output import open_csv, result_rows
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TABLE_FORMATS = (".csv", ".npz", ".parquet", ".xlsx")
+
+#The format of a table file from its extension, e.g. ".npz"
+def table_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in TABLE_FORMATS:
+        raise ValueError("table files must end in one of " + ", ".join(TABLE_FORMATS) + ", not " + repr(path))
+    return extension
+
+#Open a table for writing in the format of its extension, with one column per label
+def open_table(path, labels):
+    extension = table_format(path)
+    if extension == ".csv":
+        return CsvTable(path, labels)
+    if extension == ".npz":
+        return NpzTable(path, labels)
+    if extension == ".parquet":
+        return ParquetTable(path, labels)
+    return XlsxTable(path, labels)
+
+#Save the results of one analysis as a table
+def save_table(config, path, result, case=""):
+    table = open_table(path, edge_labels(config))
+    try:
+        table.write_case(case, result_rows(result))
+    finally:
+        table.close()
+
+#Row values as floats, padded with None to one value per label
+def padded_values(values, labels):
+    return [float(value) for value in values] + [None] * (len(labels) - len(values))
+
+#Table written as comma separated text. Empty values are left blank.
+class CsvTable(object):
+    def __init__(self, path, labels):
+        self.labels = labels
+        self.table_obj = open_csv(path, "w")
+        self.csv_write = csv.writer(self.table_obj)
+        self.csv_write.writerow(["case", "cells"] + list(labels))
+
+    #Add the rows of one case, as (cells, values) pairs
+    def write_case(self, case, rows):
+        for cells, values in rows:
+            self.csv_write.writerow([case, cells] + ["" if value is None else repr(value)
+                                                     for value in padded_values(values, self.labels)])
+        self.table_obj.flush()
+
+    def close(self):
+        self.table_obj.close()
+
+#Table written as a numpy .npz file. The values go to a temporary file of raw floats as the
+#cases come in, and are copied into the .npz file in pieces on close(), so they are never all
+#in memory at once.
+class NpzTable(object):
+    def __init__(self, path, labels):
+        if numpy is None:
+            raise ImportError(".npz tables need the numpy library")
+        self.path = path
+        self.labels = labels
+        self.cases = []
+        self.cells = []
+        temp_handle, self.values_path = tempfile.mkstemp(suffix=".values")
+        self.values_obj = os.fdopen(temp_handle, "wb")
+
+    def write_case(self, case, rows):
+        for cells, values in rows:
+            self.cases.append(case)
+            self.cells.append(cells)
+            row = padded_values(values, self.labels)
+            numpy.array([numpy.nan if value is None else value for value in row], dtype="<f8").tofile(self.values_obj)
+
+    def close(self):
+        self.values_obj.close()
+        try:
+            if self.cells:
+                values = numpy.memmap(self.values_path, dtype="<f8", mode="r",
+                                      shape=(len(self.cells), len(self.labels)))
+            else:
+                values = numpy.zeros((0, len(self.labels)))
+            numpy.savez(self.path, case=numpy.array(self.cases, dtype=str), cells=numpy.array(self.cells, dtype=str),
+                        distances=numpy.array(self.labels, dtype=str), values=values)
+            del values
+        finally:
+            os.remove(self.values_path)
+
+#Table written as a Parquet file, one row group per case
+class ParquetTable(object):
+    def __init__(self, path, labels):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(".parquet tables need the pyarrow library")
+        self.pyarrow = pyarrow
+        self.labels = labels
+        self.schema = pyarrow.schema([("case", pyarrow.string()), ("cells", pyarrow.string())] +
+                                     [(label, pyarrow.float64()) for label in labels])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_case(self, case, rows):
+        if not rows:
+            return
+        padded = [padded_values(values, self.labels) for cells, values in rows]
+        columns = [[case] * len(rows), [cells for cells, values in rows]]
+        for location in range(0, len(self.labels)):
+            columns.append([row[location] for row in padded])
+        arrays = [self.pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+#Table written as an .xlsx workbook with a single "Results" sheet. The workbook is opened in
+#openpyxl's write only mode, which keeps the rows written so far out of memory.
+class XlsxTable(object):
+    def __init__(self, path, labels):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportError(".xlsx tables need the openpyxl library")
+        self.path = path
+        self.labels = labels
+        self.book = openpyxl.Workbook(write_only=True)
+        self.sheet = self.book.create_sheet("Results")
+        self.sheet.append(["case", "cells"] + list(labels))
+
+    def write_case(self, case, rows):
+        for cells, values in rows:
+            self.sheet.append([case, cells] + padded_values(values, self.labels))
+
+    def close(self):
+        self.book.save(self.path)
@@ -0,0 +1,148 @@
+##Tiled mode for datasets too large to hold in memory, e.g. whole-slide scans. The input file
+##is streamed twice: once to find the ROI and layer boundaries, and once to split the cells
+##into square tiles of tile_size on disk. Each tile also gets a copy of the cells within
+##analysis_dist of it (the halo), so every pair with a seed cell in the tile can be found
+##from that one tile. The tiles are counted one at a time and the counts added up, which
+##gives exactly the clustering values of the whole sample while only one tile is in memory.
+##The simulations are streamed and tiled the same way.
+
+from __future__ import division
+
+import math
+import os
+import shutil
+import tempfile
+
+from spatial_pattern import vectorized
+from spatial_pattern.cellstore import cell_store
+from spatial_pattern.cluster import cluster_pairs
+from spatial_pattern.data import iter_cells, layer_extremes
+from spatial_pattern.simulate import sim_random
+
+#Number of cells held in memory while splitting, over all tiles, before they are written out
+TILE_BUFFER = 100000
+
+#Stream through a coordinate file once to find the ROI boundaries (as boundaries() does) and
+#the layer extremes used by layer_bands(). Returns xmin, xmax, ymin, ymax, extremes.
+def scan_file(config, path):
+    xmin = xmax = ymin = ymax = None
+    extremes = {}
+    for cell in iter_cells(config, path):
+        if xmin is None:
+            xmin, xmax, ymin, ymax = cell[1], cell[1], cell[2], cell[2]
+        if cell[1] < xmin:
+            xmin = cell[1]
+        if cell[1] > xmax:
+            xmax = cell[1]
+        if cell[2] < ymin:
+            ymin = cell[2]
+        if cell[2] > ymax:
+            ymax = cell[2]
+        layer_extremes(extremes, cell)
+    if xmin is None:
+        raise ValueError(path + " holds no cells")
+    return xmin, xmax, ymin, ymax, extremes
+
+#Tile number of a location along one axis. Tiles are tile_size wide, counted from the ROI
+#edge, and clipped to the tiles that exist.
+def tile_number(config, location, low, last_tile):
+    return min(max(int(math.floor((location - low) / config.tile_size)), 0), last_tile)
+
+#Write the buffered lines of each tile to the end of its file
+def flush_tiles(tile_lines, tile_directory):
+    for tile_key in tile_lines:
+        tile_file_obj = open(tile_file(tile_directory, tile_key), "a")
+        try:
+            tile_file_obj.writelines(tile_lines[tile_key])
+        finally:
+            tile_file_obj.close()
+    tile_lines.clear()
+
+def tile_file(tile_directory, tile_key):
+    return os.path.join(tile_directory, "tile_" + str(tile_key[0]) + "_" + str(tile_key[1]) + ".txt")
+
+#Split a stream of cells into tile files in tile_directory. Every cell is written to its own
+#tile and, as a halo cell, to every other tile it is within analysis_dist of (padded by 1 so
+#rounding can never drop a pair right at analysis_dist). Returns the keys of the tiles that
+#own at least one cell, sorted.
+def split_tiles(config, cells, xmin, xmax, ymin, ymax, tile_directory):
+    reach = config.analysis_dist + 1
+    last_x = tile_number(config, xmax, xmin, float("inf"))
+    last_y = tile_number(config, ymax, ymin, float("inf"))
+    owners = set()
+    tile_lines = {}
+    buffered = 0
+    for cell in cells:
+        owner = (tile_number(config, cell[1], xmin, last_x), tile_number(config, cell[2], ymin, last_y))
+        owners.add(owner)
+        for xkey in range(tile_number(config, cell[1] - reach, xmin, last_x), tile_number(config, cell[1] + reach, xmin, last_x) + 1):
+            for ykey in range(tile_number(config, cell[2] - reach, ymin, last_y), tile_number(config, cell[2] + reach, ymin, last_y) + 1):
+                #repr() keeps every digit of the coordinates, so distances are not changed
+                line = "\t".join((str(cell[0]), repr(cell[1]), repr(cell[2]), str(cell[3]), str(int((xkey, ykey) == owner))))
+                tile_lines.setdefault((xkey, ykey), []).append(line + "\n")
+                buffered += 1
+        if buffered >= TILE_BUFFER:
+            flush_tiles(tile_lines, tile_directory)
+            buffered = 0
+    flush_tiles(tile_lines, tile_directory)
+    return sorted(owners)
+
+#Read one tile back as a list of cells in the loadfile() format, and the owned flag of each
+#cell. Halo cells (not owned) are never seeds and are only counted as partners of the cells
+#the tile owns.
+def read_tile(config, tile_directory, tile_key):
+    tile_data = []
+    owned = []
+    tile_file_obj = open(tile_file(tile_directory, tile_key), "r")
+    try:
+        for line in tile_file_obj:
+            fields = line.split("\t")
+            tile_data.append([int(fields[0]), float(fields[1]), float(fields[2]), int(fields[3])])
+            owned.append(fields[4].strip() == "1")
+    finally:
+        tile_file_obj.close()
+    return tile_data, owned
+
+#Clustering values of each of cell_pairs for a stream of cells, counted tile by tile.
+#Counts are added up over the tiles, so the values are the same as cluster_pairs() on the
+#whole sample. The tile files are removed again afterwards.
+def tile_pass(config, cells, cell_pairs, xmin, xmax, ymin, ymax):
+    #per-tile progress would flood the output, so the tiles are counted quietly
+    tile_config = config.copy(verbose=False)
+    tile_directory = tempfile.mkdtemp(prefix="spatial_pattern_tiles_")
+    try:
+        tile_keys = split_tiles(config, cells, xmin, xmax, ymin, ymax, tile_directory)
+        totals = []
+        for cell_pair in cell_pairs:
+            totals.append([0.] * (config.interval_num + 1))
+        for tile_key in tile_keys:
+            tile_data, owned = read_tile(config, tile_directory, tile_key)
+            if config.engine == "numpy":
+                cell_type, xloc, yloc, layer, edge_ok, bounds, depth = vectorized.cell_columns(config, tile_data, xmin, xmax, ymin, ymax)
+                tile_cells = cell_type, xloc, yloc, layer, edge_ok & vectorized.numpy.array(owned, dtype=bool), bounds, depth
+            else:
+                tile_cells = cell_store(config, tile_data, xmin, xmax, ymin, ymax, owned)
+            tile_clusters = cluster_pairs(tile_config, tile_cells, cell_pairs)
+            for pair_num in range(0, len(cell_pairs)):
+                for location in range(0, config.interval_num + 1):
+                    totals[pair_num][location] += tile_clusters[pair_num][location]
+    finally:
+        shutil.rmtree(tile_directory, True)
+    return totals
+
+#Stream a simulated version of the cells in a coordinate file. The random numbers are drawn
+#in the same order as sim_gen() and sim_gen_uniform(), so with the "python" engine a run gives
+#the same simulated cells as the untiled analysis.
+def sim_stream(config, path, xmin, xmax, ymin, ymax, ybound_list, rng):
+    for cell in iter_cells(config, path):
+        if config.null_model == "layered":
+            yrand = rng.uniform(ybound_list[cell[3]-1][0], ybound_list[cell[3]-1][1])
+            yield [cell[0], rng.uniform(xmin, xmax), yrand, cell[3]]
+        else:
+            yield [cell[0], rng.uniform(xmin, xmax), rng.uniform(ymin, ymax), cell[3]]
+
+#Tiled version of sim_run(), for sim_iterate(): path is the input file instead of the cells
+def sim_run_tiled(run_count, seed, config, path, cell_pairs, xmin, xmax, ymin, ymax, ybound_list):
+    rng = sim_random(config, seed, run_count)
+    sim_cells = sim_stream(config, path, xmin, xmax, ymin, ymax, ybound_list, rng)
+    return tile_pass(config, sim_cells, cell_pairs, xmin, xmax, ymin, ymax)
@@ -0,0 +1,355 @@
+##The "numpy" engine: the cells are kept as columnar arrays and distances, bins and cumulative
+##counts are calculated with array operations. Gives the same clustering values as the pure
+##Python functions in cluster.py. Needs the numpy library.
+
+from __future__ import division
+
+from spatial_pattern.binning import bin_edges
+from spatial_pattern.data import layer_bands
+from spatial_pattern.edge import bin_radii
+from spatial_pattern.instrument import emit
+from spatial_pattern.progress import clock, report
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#Raise a clear error when the numpy engine is selected without numpy installed
+def require_numpy(config):
+    if config.engine == "numpy" and numpy is None:
+        raise ImportError('engine = "numpy" needs the numpy library')
+
+#Store the cells as columnar arrays (cell_type, xloc, yloc, layer, edge_ok, bounds, depth)
+#instead of a list of lists. edge_ok marks the cells that can be used as seeds (see
+#edge_mask) and bounds is (xmin, xmax, ymin, ymax), for the edge weights. depth is None for
+#2D cells; with dimensions = 3 it is (zloc, zmin, zmax), from data.z_bounds().
+def cell_columns(config, sp_data, xmin, xmax, ymin, ymax, zmin=None, zmax=None):
+    cell_type = numpy.array([cell[0] for cell in sp_data])
+    xloc = numpy.array([cell[1] for cell in sp_data], dtype=float)
+    yloc = numpy.array([cell[2] for cell in sp_data], dtype=float)
+    layer = numpy.array([cell[3] for cell in sp_data])
+    zloc = None
+    if config.dimensions == 3:
+        zloc = numpy.array([cell[4] for cell in sp_data], dtype=float)
+    return array_columns(config, cell_type, xloc, yloc, layer, zloc, xmin, xmax, ymin, ymax, zmin, zmax)
+
+#cell_columns() for cells that are already in arrays, e.g. the fields of a cached cell array
+#(see cellcache.py). The arrays are used as they are, without a copy; zloc is None for 2D cells.
+def array_columns(config, cell_type, xloc, yloc, layer, zloc, xmin, xmax, ymin, ymax, zmin=None, zmax=None):
+    edge_ok = edge_mask(config, xloc, yloc, xmin, xmax, ymin, ymax)
+    depth = None
+    if config.dimensions == 3:
+        edge_ok = edge_ok & depth_mask(config, zloc, zmin, zmax)
+        depth = (zloc, zmin, zmax)
+    return cell_type, xloc, yloc, layer, edge_ok, (xmin, xmax, ymin, ymax), depth
+
+#The ROI bounds (xmin, xmax, ymin, ymax) of cells in arrays, as data.roi_bounds() gives them
+def array_bounds(xloc, yloc):
+    return float(xloc.min()), float(xloc.max()), float(yloc.min()), float(yloc.max())
+
+#data.layer_ybound() for cells in arrays
+def layer_ybound_np(config, layer, yloc, ymin, ymax):
+    start = clock()
+    extremes = {}
+    for layer_value in numpy.unique(layer).tolist():
+        layer_y = yloc[layer == layer_value]
+        extremes[layer_value] = [float(layer_y.max()), float(layer_y.min())]
+    ybound_list = layer_bands(config, extremes, ymax)
+    emit(config, "layer_ybound", start, cells=len(layer), layers=len(ybound_list))
+    return ybound_list
+
+#The seed test from edge.seed_weights() applied to whole coordinate arrays: the exclusion
+#test, or every cell with the "isotropic" edge correction
+def edge_mask(config, xloc, yloc, xmin, xmax, ymin, ymax):
+    if config.edge_correction == "isotropic":
+        return numpy.ones(len(xloc), dtype=bool)
+    exclude_dist = config.exclude_dist
+    return ((abs(xloc - xmin) > exclude_dist) & (abs(xmax - xloc) > exclude_dist) &
+            (abs(yloc - ymin) > exclude_dist) & (abs(ymax - yloc) > exclude_dist))
+
+#The exclusion test along z for 3D cells: seeds closer than exclude_dist_z to the top or
+#bottom of the section are left out, or none with exclude_dist_z None
+def depth_mask(config, zloc, zmin, zmax):
+    if config.exclude_dist_z is None:
+        return numpy.ones(len(zloc), dtype=bool)
+    return (abs(zloc - zmin) > config.exclude_dist_z) & (abs(zmax - zloc) > config.exclude_dist_z)
+
+#z coordinates of the cells picked by mask, or None for 2D cells
+def depth_of(depth, mask):
+    if depth is None:
+        return None
+    return depth[0][mask]
+
+#Numpy version of edge.isotropic_weights() for a set of seeds: a table with one row of
+#weights per seed and one column per distance bin
+def edge_weights_np(config, seed_x, seed_y, bounds):
+    xmin, xmax, ymin, ymax = bounds
+    radii = numpy.array(bin_radii(config))[None, :]
+    edge_dists = [(seed_x - xmin)[:, None], (xmax - seed_x)[:, None], (seed_y - ymin)[:, None], (ymax - seed_y)[:, None]]
+    safe_radii = numpy.where(radii > 0, radii, 1.)
+    arcs = []
+    for edge_dist in edge_dists:
+        arcs.append(numpy.where(edge_dist < radii, numpy.arccos(numpy.minimum(edge_dist / safe_radii, 1.)), 0.))
+    outside = 2 * (arcs[0] + arcs[1] + arcs[2] + arcs[3])
+    for side in (0, 1):
+        for end in (2, 3):
+            corner_in = edge_dists[side]**2 + edge_dists[end]**2 < radii**2
+            outside = outside - numpy.where(corner_in, arcs[side] + arcs[end] - numpy.pi / 2, 0.)
+    inside = 1 - outside / (2 * numpy.pi)
+    #circles past the farthest corner hold no pairs (see edge.isotropic_weight)
+    return numpy.where(inside > 0, 1 / numpy.where(inside > 0, inside, 1.), 0.)
+
+#Edge weights of a block of pairs from pair_distances_np() with the "isotropic" edge
+#correction, or None (every weight 1) otherwise. seed_index points into seed_x and seed_y;
+#the weight table is worked out once for each seed in the block, not for every pair.
+#edges are the bin edges from edge_array().
+def pair_weights_np(config, edges, seed_x, seed_y, bounds, seed_index, dist):
+    if config.edge_correction != "isotropic":
+        return None
+    array_target = bin_numbers_np(config, edges, dist)
+    seeds, rows = numpy.unique(seed_index, return_inverse=True)
+    return edge_weights_np(config, seed_x[seeds], seed_y[seeds], bounds)[rows.ravel(), array_target]
+
+#Find all seed/target pairs within analysis_dist. Both sets of cells are sorted
+#along the longer ROI axis and the seeds are handled in blocks; each block is only compared
+#against the slice of targets that can lie within analysis_dist of it along that axis, so
+#memory use is bounded by block_size. Yields (seed index, target index, distance) arrays for
+#the pairs in range, with the indexes pointing into the seed and target arrays passed in.
+#With unique set the seeds and targets must be the same cells, and each pair is only
+#returned once instead of once from each end.
+#counts, if given, is a one item list that the number of distances calculated is added to.
+#With seed_z and target_z given the distances are 3D and the search goes through
+#voxel_pairs_np() instead.
+def pair_distances_np(config, seed_x, seed_y, target_x, target_y, block_size=256, unique=False, counts=None,
+                      seed_z=None, target_z=None):
+    analysis_dist = config.analysis_dist
+    if len(seed_x) == 0 or len(target_x) == 0:
+        return
+    if seed_z is not None:
+        for pairs in voxel_pairs_np(config, (seed_x, seed_y, seed_z), (target_x, target_y, target_z),
+                                    unique=unique, counts=counts):
+            yield pairs
+        return
+    if numpy.ptp(numpy.concatenate((seed_y, target_y))) > numpy.ptp(numpy.concatenate((seed_x, target_x))):
+        seed_sweep, target_sweep = seed_y, target_y
+    else:
+        seed_sweep, target_sweep = seed_x, target_x
+    seed_order = numpy.argsort(seed_sweep, kind="mergesort")
+    target_order = numpy.argsort(target_sweep, kind="mergesort")
+    target_sorted = target_sweep[target_order]
+    for start in range(0, len(seed_order), block_size):
+        block = seed_order[start:start + block_size]
+        #pad the window by 1 so rounding can never drop a pair right at analysis_dist
+        low = numpy.searchsorted(target_sorted, seed_sweep[block[0]] - analysis_dist - 1, "left")
+        high = numpy.searchsorted(target_sorted, seed_sweep[block[-1]] + analysis_dist + 1, "right")
+        if unique:
+            low = max(low, start)
+        window = target_order[low:high]
+        if counts is not None:
+            counts[0] += len(block) * len(window)
+        dist = numpy.sqrt((seed_x[block][:, None] - target_x[window][None, :])**2 +
+                          (seed_y[block][:, None] - target_y[window][None, :])**2)
+        in_range = (dist > 0) & (dist <= analysis_dist)
+        if unique:
+            #keep a pair only when the target comes after the seed in sorted order
+            in_range &= numpy.arange(low, high)[None, :] > numpy.arange(start, start + len(block))[:, None]
+        rows, columns = numpy.nonzero(in_range)
+        yield block[rows], window[columns], dist[rows, columns]
+
+#binning.bin_edges() as an array, worked out once per clustering run
+def edge_array(config):
+    return numpy.array(bin_edges(config))
+
+#Bin of each distance within analysis_dist, found exactly as cluster() does (the first edge
+#not below it)
+def bin_numbers_np(config, edges, dist):
+    return numpy.searchsorted(edges, dist, "left")
+
+#3D version of pair_distances_np(), for seed and target coordinates given as (x, y, z). The
+#cells are indexed in a grid of cubes analysis_dist wide, so every pair in range lies in the
+#same or one of the 26 neighboring cubes. The targets are sorted by cube; for each of the 27
+#cube offsets, every seed in a block is matched with all targets of the cube at that offset
+#in one set of array operations, with no loop over cells or cubes. Memory use is bounded by
+#block_size seeds times the targets of one cube.
+def voxel_pairs_np(config, seed_xyz, target_xyz, block_size=4096, unique=False, counts=None):
+    analysis_dist = config.analysis_dist
+    seed_keys = []
+    target_keys = []
+    for seed_axis, target_axis in zip(seed_xyz, target_xyz):
+        low = min(seed_axis.min(), target_axis.min())
+        #keys start at 1, so the cubes around every cell have keys of 0 or more
+        seed_keys.append(numpy.floor((seed_axis - low) / analysis_dist).astype(numpy.int64) + 1)
+        target_keys.append(numpy.floor((target_axis - low) / analysis_dist).astype(numpy.int64) + 1)
+    #one cube of padding on every side, so a neighbor offset never wraps to another row
+    shape = [max(seed_key.max(), target_key.max()) + 2 for seed_key, target_key in zip(seed_keys, target_keys)]
+    seed_cube = (seed_keys[0] * shape[1] + seed_keys[1]) * shape[2] + seed_keys[2]
+    target_cube = (target_keys[0] * shape[1] + target_keys[1]) * shape[2] + target_keys[2]
+    target_order = numpy.argsort(target_cube, kind="mergesort")
+    sorted_cubes = target_cube[target_order]
+    offsets = []
+    for xstep in (-1, 0, 1):
+        for ystep in (-1, 0, 1):
+            for zstep in (-1, 0, 1):
+                offsets.append((xstep * shape[1] + ystep) * shape[2] + zstep)
+    seed_x, seed_y, seed_z = seed_xyz
+    target_x, target_y, target_z = target_xyz
+    for start in range(0, len(seed_x), block_size):
+        block = numpy.arange(start, min(start + block_size, len(seed_x)))
+        for offset in offsets:
+            first = numpy.searchsorted(sorted_cubes, seed_cube[block] + offset, "left")
+            pair_counts = numpy.searchsorted(sorted_cubes, seed_cube[block] + offset, "right") - first
+            pair_total = int(pair_counts.sum())
+            if pair_total == 0:
+                continue
+            if counts is not None:
+                counts[0] += pair_total
+            #each seed is repeated once per target in the cube, and the targets are the run
+            #of sorted positions starting at first
+            seed_index = numpy.repeat(block, pair_counts)
+            run_start = numpy.repeat(numpy.cumsum(pair_counts) - pair_counts, pair_counts)
+            target_index = target_order[numpy.repeat(first, pair_counts) + numpy.arange(pair_total) - run_start]
+            dist = numpy.sqrt((seed_x[seed_index] - target_x[target_index])**2 +
+                              (seed_y[seed_index] - target_y[target_index])**2 +
+                              (seed_z[seed_index] - target_z[target_index])**2)
+            in_range = (dist > 0) & (dist <= analysis_dist)
+            if unique:
+                in_range &= target_index > seed_index
+            yield seed_index[in_range], target_index[in_range], dist[in_range]
+
+#Histogram of pair counts per distance bin, binned exactly as in cluster(). With weights
+#(from pair_weights_np) every pair counts with its weight.
+def bin_counts_np(config, edges, dist, weights=None):
+    return numpy.bincount(bin_numbers_np(config, edges, dist), weights, minlength=len(edges))
+
+#Numpy engine version of cluster(). Distances and bins are calculated exactly as in
+#cluster(), so the output is identical.
+def cluster_np(config, sp_columns, cell1, cell2):
+    start = clock()
+    report(config, "cluster in: " + str(start))
+    cell_type, xloc, yloc, layer, edge_ok, bounds, depth = sp_columns
+    seed = (cell_type == cell1) & edge_ok
+    target = cell_type == cell2
+    edges = edge_array(config)
+    pair_hist = numpy.zeros(len(edges), dtype=numpy.int64)
+    examined = [0]
+    #selected once here, not for every block of seeds
+    seed_x, seed_y, target_x, target_y = xloc[seed], yloc[seed], xloc[target], yloc[target]
+    weights = None
+    for seed_index, target_index, dist in pair_distances_np(config, seed_x, seed_y, target_x, target_y,
+                                                            counts=examined, seed_z=depth_of(depth, seed),
+                                                            target_z=depth_of(depth, target)):
+        if config.edge_correction == "isotropic":
+            weights = pair_weights_np(config, edges, seed_x, seed_y, bounds, seed_index, dist)
+        pair_hist = pair_hist + bin_counts_np(config, edges, dist, weights)
+    data_cluster = numpy.cumsum(pair_hist).astype(float).tolist()
+    seeds = int(numpy.count_nonzero(seed))
+    emit(config, "cluster", start, cells=len(cell_type), seeds=seeds,
+         seeds_excluded=int(numpy.count_nonzero(cell_type == cell1)) - seeds, pairs_examined=examined[0],
+         pairs_in_range=pair_hist.sum().item())
+    report(config, "cluster out: " + str(clock()))
+    return data_cluster
+
+#Numpy engine version of cluster_pair(): every cell1-cell2 distance is calculated once and
+#counted for each direction whose seed cell passes the exclusion test.
+def cluster_pair_np(config, sp_columns, cell1, cell2):
+    start = clock()
+    report(config, "cluster in: " + str(start))
+    cell_type, xloc, yloc, layer, edge_ok, bounds, depth = sp_columns
+    seed = cell_type == cell1
+    target = cell_type == cell2
+    seed_ok, target_ok = edge_ok[seed], edge_ok[target]
+    edges = edge_array(config)
+    pair_hist1 = numpy.zeros(len(edges), dtype=numpy.int64)
+    pair_hist2 = numpy.zeros(len(edges), dtype=numpy.int64)
+    examined = [0]
+    #selected once here, not for every block of seeds
+    seed_x, seed_y, target_x, target_y = xloc[seed], yloc[seed], xloc[target], yloc[target]
+    weights1 = weights2 = None
+    for seed_index, target_index, dist in pair_distances_np(config, seed_x, seed_y, target_x, target_y,
+                                                            counts=examined, seed_z=depth_of(depth, seed),
+                                                            target_z=depth_of(depth, target)):
+        keep1, keep2 = seed_ok[seed_index], target_ok[target_index]
+        if config.edge_correction == "isotropic":
+            weights1 = pair_weights_np(config, edges, seed_x, seed_y, bounds, seed_index[keep1], dist[keep1])
+            weights2 = pair_weights_np(config, edges, target_x, target_y, bounds, target_index[keep2], dist[keep2])
+        pair_hist1 = pair_hist1 + bin_counts_np(config, edges, dist[keep1], weights1)
+        pair_hist2 = pair_hist2 + bin_counts_np(config, edges, dist[keep2], weights2)
+    cluster1 = numpy.cumsum(pair_hist1).astype(float)
+    cluster2 = numpy.cumsum(pair_hist2).astype(float)
+    data_cluster = ((cluster1 + cluster2) / 2).tolist()
+    seeds = int(numpy.count_nonzero(seed_ok)) + int(numpy.count_nonzero(target_ok))
+    emit(config, "cluster", start, cells=len(cell_type), seeds=seeds,
+         seeds_excluded=len(seed_ok) + len(target_ok) - seeds, pairs_examined=examined[0],
+         pairs_in_range=(pair_hist1.sum() + pair_hist2.sum()).item())
+    report(config, "cluster out: " + str(clock()))
+    return data_cluster
+
+#Numpy engine version of cluster_matrix(), returning the same nested lists of pair counts
+def cluster_matrix_np(config, sp_columns, cell_types):
+    start = clock()
+    report(config, "cluster in: " + str(start))
+    cell_type, xloc, yloc, layer, edge_ok, bounds, depth = sp_columns
+    type_total = len(cell_types)
+    edges = edge_array(config)
+    bin_total = len(edges)
+    cell_slot = numpy.zeros(len(cell_type), dtype=numpy.int64)
+    for position in range(0, type_total):
+        cell_slot[cell_type == cell_types[position]] = position
+    chosen = numpy.isin(cell_type, cell_types)
+    cell_slot, cell_ok, xloc, yloc = cell_slot[chosen], edge_ok[chosen], xloc[chosen], yloc[chosen]
+    zloc = depth_of(depth, chosen)
+    #one flat histogram indexed by (seed type, partner type, distance bin)
+    pair_hist = numpy.zeros(type_total * type_total * bin_total, dtype=numpy.int64)
+    examined = [0]
+    weights1 = weights2 = None
+    for first, second, dist in pair_distances_np(config, xloc, yloc, xloc, yloc, unique=True, counts=examined,
+                                                 seed_z=zloc, target_z=zloc):
+        array_target = bin_numbers_np(config, edges, dist)
+        forward = (cell_slot[first] * type_total + cell_slot[second]) * bin_total + array_target
+        backward = (cell_slot[second] * type_total + cell_slot[first]) * bin_total + array_target
+        keep1, keep2 = cell_ok[first], cell_ok[second]
+        if config.edge_correction == "isotropic":
+            weights1 = pair_weights_np(config, edges, xloc, yloc, bounds, first[keep1], dist[keep1])
+            weights2 = pair_weights_np(config, edges, xloc, yloc, bounds, second[keep2], dist[keep2])
+        pair_hist = pair_hist + numpy.bincount(forward[keep1], weights1, minlength=len(pair_hist))
+        pair_hist = pair_hist + numpy.bincount(backward[keep2], weights2, minlength=len(pair_hist))
+    seeds = int(numpy.count_nonzero(cell_ok))
+    emit(config, "cluster", start, cells=len(cell_type), seeds=seeds, seeds_excluded=len(cell_ok) - seeds,
+         pairs_examined=examined[0], pairs_in_range=pair_hist.sum().item())
+    report(config, "cluster out: " + str(clock()))
+    return pair_hist.reshape(type_total, type_total, bin_total).tolist()
+
+#Layer geometry for sim_gen_np(), worked out once per sample and reused by every simulation
+#run and every cell pair: the start and height of the ybound_list band of each cell's layer.
+#Returns (band_start, band_height) arrays with one value per cell.
+def layer_geometry(config, sp_columns, ybound_list):
+    cell_type, xloc, yloc, layer, edge_ok, bounds, depth = sp_columns
+    ybound = numpy.array([[layer_bound[0], layer_bound[1]] for layer_bound in ybound_list])
+    band_start = ybound[layer - 1, 0]
+    return band_start, ybound[layer - 1, 1] - band_start
+
+#Numpy engine version of sim_gen(): draw every simulated location at once. The cell types
+#and layers are reused; only the coordinates are new. layer_bands comes from
+#layer_geometry(), so a run only draws two blocks of random numbers and scales them. The
+#values are the same as rng.uniform() with the band of each cell would give.
+def sim_gen_np(config, sp_columns, xmin, xmax, ymin, ymax, layer_bands, rng):
+    cell_type, xloc, yloc, layer, edge_ok, bounds, depth = sp_columns
+    band_start, band_height = layer_bands
+    sim_x = rng.uniform(xmin, xmax, len(xloc))
+    sim_y = band_start + band_height * rng.random_sample(len(yloc))
+    return cell_type, sim_x, sim_y, layer, edge_mask(config, sim_x, sim_y, xmin, xmax, ymin, ymax), bounds, depth
+
+#Numpy engine version of sim_gen_uniform(): every cell anywhere in the ROI, or anywhere in
+#the box of the section in 3D
+def sim_gen_uniform_np(config, sp_columns, xmin, xmax, ymin, ymax, rng):
+    cell_type, xloc, yloc, layer, edge_ok, bounds, depth = sp_columns
+    sim_x = rng.uniform(xmin, xmax, len(xloc))
+    sim_y = rng.uniform(ymin, ymax, len(yloc))
+    edge_ok = edge_mask(config, sim_x, sim_y, xmin, xmax, ymin, ymax)
+    if depth is not None:
+        zloc, zmin, zmax = depth
+        sim_z = rng.uniform(zmin, zmax, len(zloc))
+        edge_ok = edge_ok & depth_mask(config, sim_z, zmin, zmax)
+        depth = (sim_z, zmin, zmax)
+    return cell_type, sim_x, sim_y, layer, edge_ok, bounds, depth
@@ -0,0 +1,238 @@
+##Watch folder service: a long running process that analyzes every coordinate file dropped
+##into a directory, e.g. a share that microscopy rigs export to. Needs Python 3.7 or later
+##(asyncio); it is not imported by the package itself, so the rest of the package still runs
+##on Python 2. See SpatialPatternWatch.py for the ready to run program.
+##
+##The directory is scanned every poll_interval seconds. A .txt file is taken on once its size
+##and modification time are the same in two scans in a row, so files still being copied are
+##left alone. Cases are analyzed with batch.run_case() on a pool of worker processes, and the
+##scans, queue and status files are handled in the main process by asyncio, so new files are
+##noticed while cases run. The queue holds at most queue_size cases; when it is full, new
+##files wait in the directory and are queued in a later scan (backpressure), instead of the
+##scan waiting for room. A worker process that dies (e.g. out of memory) fails only its own
+##case; the pool is replaced and the service carries on.
+##
+##Next to the outputs of each case (as in run_batch()) a status file, output_name +
+##"_status.json", records its state ("queued", "running", "done" or "failed", with the error)
+##and the size and modification time of the input file it was made from. A file is analyzed
+##again only when it changes, so restarting the service after a stop or crash does not redo
+##finished cases; cases that failed or were cut off are tried again on restart.
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import time
+import traceback
+
+from spatial_pattern.batch import case_done, case_results_path, run_case
+from spatial_pattern.output import check_output_format
+
+#Size and modification time of a file, to notice new and changed input files
+def file_stamp(path):
+    info = os.stat(path)
+    return [info.st_size, info.st_mtime]
+
+def status_path(output_directory, output_name):
+    return os.path.join(output_directory, output_name + "_status.json")
+
+#Write the status of a case. The file is written under a temporary name and renamed, so it is
+#never seen half written.
+def write_status(output_directory, output_name, state, stamp, error=None):
+    status = {"state": state, "input_stamp": stamp, "time": time.time()}
+    if error is not None:
+        status["error"] = error
+    path = status_path(output_directory, output_name)
+    with open(path + ".tmp", "w") as status_obj:
+        json.dump(status, status_obj)
+    os.replace(path + ".tmp", path)
+
+#The status of a case as a dictionary, or None when it has no (readable) status file
+def read_status(output_directory, output_name):
+    try:
+        with open(status_path(output_directory, output_name), "r") as status_obj:
+            return json.load(status_obj)
+    except (OSError, ValueError):
+        return None
+
+#Whether an input file with this stamp has been analyzed already: its case is done and its
+#status file says so for this stamp. Results without a status file (e.g. from run_batch()
+#into the same output directory) count as done.
+def stamp_done(output_directory, output_name, stamp):
+    if not case_done(output_directory, output_name):
+        return False
+    status = read_status(output_directory, output_name)
+    return status is None or (status.get("state") == "done" and status.get("input_stamp") == stamp)
+
+#Mark a case as queued. Results of an earlier version of the input file are removed first, so
+#that they are never taken for the results of this one if the case fails or is cut off.
+def queue_case(output_directory, output_name, stamp):
+    results_path = case_results_path(output_directory, output_name)
+    if os.path.exists(results_path):
+        os.remove(results_path)
+    write_status(output_directory, output_name, "queued", stamp)
+
+#The .txt files in a directory with their stamps. Files that disappear while listing are
+#left out.
+def list_inputs(watch_directory):
+    inputs = []
+    for file_name in sorted(os.listdir(watch_directory)):
+        if file_name.lower().endswith(".txt") and not file_name.startswith("."):
+            try:
+                inputs.append((file_name, file_stamp(os.path.join(watch_directory, file_name))))
+            except OSError:
+                continue
+    return inputs
+
+#The process pool the cases run on. running is the number of cases handed to it, and
+#broken_running that number at the time the pool was found broken.
+class CasePool(object):
+    def __init__(self, workers):
+        self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+        self.running = 0
+        self.broken_running = None
+
+#The state of one watch folder service. Use watch_folder() to run it.
+#workers is the number of cases analyzed at the same time (0 uses every core) and queue_size
+#the number of cases waiting for a worker (None for twice workers). Each case is saved as
+#output_name + "." + output_format, as in run_batch(). Inside the service the simulations of
+#each case always run in the case's own process.
+class FolderWatch(object):
+    def __init__(self, config, watch_directory, output_directory, workers=0, queue_size=None,
+                 poll_interval=5., output_format="xls"):
+        check_output_format(config, output_format)
+        self.config = config.copy(sim_workers=1)
+        self.watch_directory = watch_directory
+        self.output_directory = output_directory
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size or 2 * self.workers
+        self.poll_interval = poll_interval
+        self.output_format = output_format
+        #stamp of each file at the last scan, of the queued and running cases, and of the
+        #cases finished (done or failed) by this service or found done on disk
+        self.seen = {}
+        self.active = {}
+        self.finished = {}
+        self.failed = []
+        self.queue = None
+        self.pool = None
+
+    #Run a blocking file operation on a thread, so that the event loop never waits on disk
+    async def in_thread(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    #Scan the directory once and queue the files that are new or changed and have settled.
+    #Returns the number of files that are not finished yet, queued or running included.
+    async def scan(self):
+        waiting = 0
+        for file_name, stamp in await self.in_thread(list_inputs, self.watch_directory):
+            if self.finished.get(file_name) == stamp:
+                continue
+            waiting += 1
+            if file_name in self.active:
+                continue
+            if self.seen.get(file_name) != stamp:
+                #new or still being written; check again in the next scan
+                self.seen[file_name] = stamp
+                continue
+            output_name = os.path.splitext(file_name)[0]
+            if await self.in_thread(stamp_done, self.output_directory, output_name, stamp):
+                print("already done: " + file_name)
+                self.finished[file_name] = stamp
+                waiting -= 1
+                continue
+            if self.queue.full():
+                continue
+            self.active[file_name] = stamp
+            await self.in_thread(queue_case, self.output_directory, output_name, stamp)
+            self.queue.put_nowait((file_name, stamp))
+        return waiting
+
+    #A worker process that dies (e.g. out of memory) breaks the whole pool, and a broken pool
+    #fails every case handed to it afterwards. The first worker coroutine to find it broken
+    #replaces it with a new pool, which the other coroutines then use as well.
+    def replace_pool(self, pool):
+        if pool is self.pool:
+            pool.broken_running = pool.running
+            pool.executor.shutdown(wait=False)
+            self.pool = CasePool(self.workers)
+
+    #Analyze one case on the process pool. Returns the error message, or None when it worked.
+    #When the pool breaks, a case that was running on its own is what broke it and fails; cases
+    #that were running next to others are run once more on the new pool, and fail only if they
+    #break that one as well.
+    async def run_on_pool(self, file_name, output_name):
+        loop = asyncio.get_running_loop()
+        retried = False
+        while True:
+            pool = self.pool
+            pool.running += 1
+            try:
+                case, error = await loop.run_in_executor(pool.executor, run_case, [file_name, output_name],
+                                                         self.config, self.watch_directory, self.output_directory,
+                                                         self.output_format)
+                return error
+            except concurrent.futures.BrokenExecutor:
+                #run_case() catches everything else
+                self.replace_pool(pool)
+                if retried or pool.broken_running == 1:
+                    return traceback.format_exc()
+                retried = True
+                print("worker process died, running again: " + file_name)
+            finally:
+                pool.running -= 1
+
+    #Worker coroutine: hand queued cases to the process pool one at a time
+    async def work(self):
+        while True:
+            file_name, stamp = await self.queue.get()
+            output_name = os.path.splitext(file_name)[0]
+            try:
+                await self.in_thread(write_status, self.output_directory, output_name, "running", stamp)
+                start_time = time.time()
+                error = await self.run_on_pool(file_name, output_name)
+                if error is None:
+                    await self.in_thread(write_status, self.output_directory, output_name, "done", stamp)
+                    print("case done: " + file_name + " (" + str(int(time.time() - start_time)) + " s)")
+                else:
+                    await self.in_thread(write_status, self.output_directory, output_name, "failed", stamp, error)
+                    print("case failed: " + file_name)
+                    print(error)
+                    self.failed.append(file_name)
+                #a failed file is only tried again once it changes, or after a restart
+                self.finished[file_name] = stamp
+            finally:
+                del self.active[file_name]
+                self.queue.task_done()
+
+    #Watch the directory until cancelled, or with until_idle set until every file in it is
+    #finished. Returns the names of the files that failed.
+    async def run(self, until_idle=False):
+        if not os.path.isdir(self.output_directory):
+            os.makedirs(self.output_directory)
+        self.queue = asyncio.Queue(self.queue_size)
+        self.pool = CasePool(self.workers)
+        tasks = [asyncio.ensure_future(self.work()) for unused in range(0, self.workers)]
+        try:
+            while True:
+                waiting = await self.scan()
+                if until_idle and waiting == 0:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.pool.executor.shutdown()
+        return self.failed
+
+#Run the watch folder service on watch_directory (see FolderWatch for the settings). Runs
+#until interrupted, or with until_idle set until every file in the directory is finished,
+#which is useful for one-off runs and for trying the service on a temporary directory.
+#Returns the names of the files that failed.
+def watch_folder(config, watch_directory, output_directory, workers=0, queue_size=None, poll_interval=5.,
+                 output_format="xls", until_idle=False):
+    watch = FolderWatch(config, watch_directory, output_directory, workers, queue_size, poll_interval,
+                        output_format)
+    print("watching " + watch_directory + " with " + str(watch.workers) + " workers")
+    return asyncio.run(watch.run(until_idle))